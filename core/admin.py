@@ -753,6 +753,11 @@ class TimetableAdmin(admin.ModelAdmin):
     list_filter = ["term"]
 
 
+class PushDeliveryStatsAdmin(admin.ModelAdmin):
+    list_display = ["date", "sent", "delivered", "failed", "unregistered", "expired"]
+    date_hierarchy = "date"
+
+
 class CustomFlatPageAdmin(FlatPageAdmin):
     formfield_overrides = {
         django.db.models.TextField: {"widget": AdminMartorWidget},
@@ -821,6 +826,7 @@ admin.site.register(models.Tag, TagAdmin)
 admin.site.register(models.Event, EventAdmin)
 admin.site.register(models.Raffle, RaffleAdmin)
 admin.site.register(models.StaffMember)
+admin.site.register(models.PushDeliveryStats, PushDeliveryStatsAdmin)
 
 admin.site.unregister(FlatPage)
 admin.site.register(FlatPage, CustomFlatPageAdmin)
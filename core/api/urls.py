@@ -14,6 +14,7 @@ from .views import (
     Feeds,
     MartorImageUpload,
     NotificationsNew,
+    NotificationStreamStats,
     NotifToken,
     OrganizationDetail,
     TermCurrent,
@@ -21,6 +22,7 @@ from .views import (
     TermDetail,
     TermList,
     TermSchedule,
+    TermScheduleRange,
     TermScheduleWeek,
     TimetableDetails,
     TimetableList,
@@ -59,6 +61,11 @@ urlpatterns = [
         NotificationsNew.as_view(),
         name="api_notification_new",
     ),
+    path(
+        "notifications/stats",
+        NotificationStreamStats.as_view(),
+        name="api_notification_stats",
+    ),
     path(
         "announcements/feed",
         AnnouncementListMyFeed.as_view(),
@@ -119,6 +126,11 @@ urlpatterns = [
         TermScheduleWeek.as_view(),
         name="api_term_schedule_week",
     ),
+    path(
+        "term/<int:pk>/schedule/range",
+        TermScheduleRange.as_view(),
+        name="api_term_schedule_range",
+    ),
     path("v3/staff", staff, name="api_staff3"),
     path("v3/feeds", Feeds.as_view(), name="api_feeds3"),
     path(
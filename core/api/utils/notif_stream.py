@@ -0,0 +1,400 @@
+"""
+Fan-out of live notification events to the /api/notifications/new streams.
+
+An event is published once per save and every open stream receives it, in publication order.
+Events are numbered, and the last NOTIF_STREAM_HISTORY of them are kept so that a reconnecting client
+can replay what it missed from its Last-Event-ID.
+InMemoryBroker only reaches streams in the same process and is meant for development and tests;
+RedisBroker goes through Redis pub/sub so that streams on every worker see every event.
+The broker is chosen with NOTIF_STREAM_BROKER.
+
+Under ASGI, AsyncHub shares a single broker subscription among all the streams of the event loop,
+so an idle stream costs a coroutine and a queue.
+That subscription is made with async_subscribe and read on the event loop itself, without a thread.
+
+Every event is serialized and encoded into its SSE frame once, by the publisher;
+brokers and hubs hand the same bytes to every stream.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import queue
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass
+from functools import cache
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    id: int | None
+    frame: bytes  # the complete SSE frame, shared by every stream
+
+    @classmethod
+    def from_frame(cls, frame: bytes) -> Event:
+        # frames of published events always start with their id line
+        return cls(int(frame[4 : frame.index(b"\n")]), frame)
+
+
+def encode_body(event_name: str, data) -> bytes:
+    """
+    Encodes the part of an SSE frame after its id line.
+    """
+    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+INIT_EVENT = Event(
+    None, encode_body("init", {})
+)  # no id, so the client's Last-Event-ID is kept
+HEARTBEAT = b": heartbeat\n\n"  # a comment, ignored by EventSource
+
+
+class StreamMetrics:
+    """
+    Process-wide counters of the notification streams.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = 0
+        self.published = 0
+        self.fanouts = 0
+        self.deliveries = 0
+        self.fanout_secs = 0.0
+        self.fanout_secs_max = 0.0
+
+    def stream_opened(self):
+        with self.lock:
+            self.subscribers += 1
+
+    def stream_closed(self):
+        with self.lock:
+            self.subscribers -= 1
+
+    def record_publish(self):
+        with self.lock:
+            self.published += 1
+
+    def record_fanout(self, subscribers: int, secs: float):
+        with self.lock:
+            self.fanouts += 1
+            self.deliveries += subscribers
+            self.fanout_secs += secs
+            self.fanout_secs_max = max(self.fanout_secs_max, secs)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "subscribers": self.subscribers,
+                "published": self.published,
+                "fanouts": self.fanouts,
+                "deliveries": self.deliveries,
+                "fanout_secs_avg": self.fanout_secs / self.fanouts
+                if self.fanouts
+                else 0.0,
+                "fanout_secs_max": self.fanout_secs_max,
+            }
+
+
+metrics = StreamMetrics()
+
+
+class Subscription:
+    def get(self, timeout: float | None = None) -> Event | None:
+        """
+        Returns the next event, or None if there was none within timeout seconds (None waits forever).
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class AsyncSubscription:
+    """
+    A subscription read from an event loop, made with the broker's async_subscribe.
+    """
+
+    async def get(self, timeout: float | None = None) -> Event | None:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class InMemorySubscription(Subscription):
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        # FIFO, so events arrive in the order they were published
+        self.queue = queue.SimpleQueue()
+
+    def put(self, event: Event):
+        self.queue.put(event)
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryAsyncSubscription(AsyncSubscription):
+    def __init__(self, broker: InMemoryBroker, loop: asyncio.AbstractEventLoop):
+        self.broker = broker
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, event: Event):
+        # publishers run in other threads; callbacks are run in the order they were scheduled
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+
+    async def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=settings.NOTIF_STREAM_HISTORY)
+        self.last_id = 0
+
+    def publish(self, event_name: str, data) -> Event:
+        body = encode_body(event_name, data)
+        metrics.record_publish()
+        # numbering and delivery under one lock, so concurrent publishers cannot interleave
+        with self.lock:
+            self.last_id += 1
+            event = Event(self.last_id, f"id: {self.last_id}\n".encode() + body)
+            self.history.append(event)
+            start = time.perf_counter()
+            for subscription in self.subscribers:
+                subscription.put(event)
+            metrics.record_fanout(len(self.subscribers), time.perf_counter() - start)
+        return event
+
+    def replay(self, last_id: int) -> list[Event]:
+        """
+        Returns the retained events published after last_id, oldest first.
+        """
+        with self.lock:
+            return [event for event in self.history if event.id > last_id]
+
+    def subscribe(self) -> InMemorySubscription:
+        subscription = InMemorySubscription(self)
+        with self.lock:
+            self.subscribers.add(subscription)
+        return subscription
+
+    async def async_subscribe(self) -> InMemoryAsyncSubscription:
+        subscription = InMemoryAsyncSubscription(self, asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(
+        self, subscription: InMemorySubscription | InMemoryAsyncSubscription
+    ):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+
+class RedisSubscription(Subscription):
+    def __init__(self, pubsub: redis.client.PubSub):
+        self.pubsub = pubsub
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = (
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+            # subscribe confirmations are skipped and returned as None, hence the loop
+            message = self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                return Event.from_frame(message["data"])
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisAsyncSubscription(AsyncSubscription):
+    def __init__(
+        self, client: redis.asyncio.Redis, pubsub: redis.asyncio.client.PubSub
+    ):
+        self.client = client
+        self.pubsub = pubsub
+
+    async def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = (
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+            message = await self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                return Event.from_frame(message["data"])
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    async def close(self):
+        await self.pubsub.close()
+        await self.client.close()
+
+
+# numbers the event, keeps it in the history and publishes it atomically, so ids follow publication order
+PUBLISH_SCRIPT = r"""
+local id = redis.call("INCR", KEYS[1])
+local payload = "id: " .. id .. "\n" .. ARGV[1]
+redis.call("RPUSH", KEYS[2], payload)
+redis.call("LTRIM", KEYS[2], -tonumber(ARGV[2]), -1)
+redis.call("PUBLISH", ARGV[3], payload)
+return payload
+"""
+
+
+class RedisBroker:
+    def __init__(self):
+        self.client = redis.Redis.from_url(settings.NOTIF_STREAM_REDIS_URL)
+        self.channel = settings.NOTIF_STREAM_CHANNEL
+        self.id_key = f"{self.channel}:id"
+        self.history_key = f"{self.channel}:history"
+        self.publish_script = self.client.register_script(PUBLISH_SCRIPT)
+
+    def publish(self, event_name: str, data) -> Event:
+        frame = self.publish_script(
+            keys=[self.id_key, self.history_key],
+            args=[
+                encode_body(event_name, data),
+                settings.NOTIF_STREAM_HISTORY,
+                self.channel,
+            ],
+        )
+        metrics.record_publish()
+        return Event.from_frame(frame)
+
+    def replay(self, last_id: int) -> list[Event]:
+        events = (
+            Event.from_frame(frame)
+            for frame in self.client.lrange(self.history_key, 0, -1)
+        )
+        return [event for event in events if event.id > last_id]
+
+    def subscribe(self) -> RedisSubscription:
+        pubsub = self.client.pubsub()
+        pubsub.subscribe(self.channel)
+        return RedisSubscription(pubsub)
+
+    async def async_subscribe(self) -> RedisAsyncSubscription:
+        # asyncio connections belong to the event loop that made them, so each subscription has its own client
+        client = redis.asyncio.Redis.from_url(settings.NOTIF_STREAM_REDIS_URL)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.channel)
+        return RedisAsyncSubscription(client, pubsub)
+
+
+@cache
+def get_broker():
+    return import_string(settings.NOTIF_STREAM_BROKER)()
+
+
+OVERFLOW = object()  # put in the queue of a stream that fell too far behind
+
+
+class AsyncHub:
+    """
+    Relays the events of one broker subscription to the queues of every stream on an event loop.
+    The subscription is read by a single listener task, which stops once the last stream is gone.
+    Streams wait for subscribed() before replaying, so nothing published in between is missed.
+    """
+
+    POLL_SECS = 1.0  # how long the listener can outlive the last stream
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.queues = set()
+        self.listener = None
+        self.ready = None  # set once the listener's subscription exists
+
+    def subscribe(self) -> asyncio.Queue:
+        stream_queue = asyncio.Queue(maxsize=settings.NOTIF_STREAM_QUEUE_SIZE)
+        self.queues.add(stream_queue)
+        if self.listener is None or self.listener.done():
+            self.ready = asyncio.Event()
+            self.listener = asyncio.create_task(self.listen())
+        return stream_queue
+
+    async def subscribed(self):
+        """
+        Waits until the broker subscription that feeds the queues exists, raising if it could not be made.
+        """
+        await self.ready.wait()
+        if self.listener.done() and not self.listener.cancelled():
+            if error := self.listener.exception():
+                raise error
+
+    def unsubscribe(self, stream_queue: asyncio.Queue):
+        self.queues.discard(stream_queue)
+
+    async def listen(self):
+        try:
+            subscription = await self.broker.async_subscribe()
+        finally:
+            self.ready.set()
+        try:
+            while self.queues:
+                # only the listener waits on the broker, streams wait on their queue
+                event = await subscription.get(self.POLL_SECS)
+                if event is not None:
+                    self.relay(event)
+        finally:
+            await subscription.close()
+
+    def relay(self, event: Event):
+        start = time.perf_counter()
+        queues = list(self.queues)
+        for stream_queue in queues:
+            try:
+                stream_queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # the client will reconnect and replay from its Last-Event-ID
+                self.queues.discard(stream_queue)
+                while not stream_queue.empty():
+                    stream_queue.get_nowait()
+                stream_queue.put_nowait(OVERFLOW)
+        metrics.record_fanout(len(queues), time.perf_counter() - start)
+
+
+hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub(broker) -> AsyncHub:
+    loop = asyncio.get_running_loop()
+    hub = hubs.get(loop)
+    if hub is None or hub.broker is not broker:
+        hub = hubs[loop] = AsyncHub(broker)
+    return hub
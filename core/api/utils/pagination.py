@@ -0,0 +1,96 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+def reverse_ordering(ordering):
+    return tuple(
+        field[1:] if field.startswith("-") else f"-{field}" for field in ordering
+    )
+
+
+def keyset_filter(ordering, position) -> Q:
+    """
+    Matches the rows that come after position, a value for every field of ordering:
+    (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ..., with < for descending fields.
+    """
+    after, equal = Q(), Q()
+    for field, value in zip(ordering, position):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        after |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    return after
+
+
+class ObjectCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the object list endpoints, ordered by the provider's cursor_ordering.
+    The cursor holds the value of every ordering field for the row it starts after,
+    so a page is a single indexed range query: there is no COUNT and no OFFSET, however many rows share a value.
+    Ordering fields must not be null.
+    """
+
+    page_size_query_param = "limit"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = view.provider.cursor_ordering
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = None if self.cursor is None else self.cursor.position
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(ordering, position))
+
+        # one extra row tells whether there is a page beyond this one
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        if (self.has_next or self.has_previous) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor._replace(position=position)
+
+    def link_from(self, instance, reverse: bool) -> str:
+        position = [getattr(instance, field.lstrip("-")) for field in self.ordering]
+        # str keeps dates and times at full precision
+        return self.encode_cursor(
+            Cursor(
+                offset=0, reverse=reverse, position=json.dumps(position, default=str)
+            )
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:  # nothing left before the cursor, start over
+            return self.encode_cursor(Cursor(offset=0, reverse=False, position=None))
+        return self.link_from(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.link_from(self.page[0], reverse=True)
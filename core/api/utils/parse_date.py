@@ -3,8 +3,8 @@ import datetime
 from django.utils import timezone
 
 
-def parse_date_query_param(request):
-    date_query_param = request.query_params.get("date")
+def parse_date_query_param(request, name="date"):
+    date_query_param = request.query_params.get(name)
 
     if date_query_param is None:
         return timezone.localdate()
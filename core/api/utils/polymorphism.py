@@ -1,13 +1,12 @@
 from __future__ import annotations
 
 from json import JSONDecodeError
-from typing import Any, Callable, Dict, Iterable, List, Optional, Protocol, Set
+from typing import Callable, Dict, FrozenSet, List, Mapping, Optional, Protocol
 
 from django.conf import settings
 from django.core.exceptions import BadRequest
 from django.db.models import Model, Q
 from django.shortcuts import get_object_or_404
-from memoization import cached
 from rest_framework import generics
 from rest_framework.serializers import BaseSerializer
 
@@ -29,45 +28,9 @@ from core.api.v3.objects import (
 from core.api.v3.objects.base import BaseProvider
 from core.utils.types import APIObjOperations
 
-type IgnoredKey = str | Iterable[str]
 type SerializerItems = Dict[str, BaseSerializer]
 
 
-class SplitDictResult:
-    def __init__(self, new: dict, old: dict, default: IgnoredKey):
-        self.new = new
-        self.old = old
-        self.default = default
-
-    def get(self, item) -> Any:
-        return self.new.get(item, self.old.get(self.default))
-
-    def __getitem__(self, key):
-        return self.get(key)
-
-
-def split_dict_wrapper(
-    ignore: IgnoredKey,
-) -> Callable[[Dict[str, Any]], SplitDictResult]:
-    """
-    Note: this will fail as the dict must be frozen so LRU cache can hash it
-    """
-
-    @cached
-    def split_dict(dictionary: SerializerItems) -> SplitDictResult:
-        new = {
-            k: v
-            for k, v in dictionary.items()
-            if (k not in ignore if isinstance(ignore, Iterable) else k != ignore)
-        }
-        return SplitDictResult(new, dictionary, ignore)
-
-    return split_dict
-
-
-splitter = split_dict_wrapper("_")  # ignore key for serializers
-
-
 def get_path_by_provider(provider: BaseProvider) -> str:
     return [
         provider_key for provider_key, prov in providers.items() if prov == provider
@@ -141,24 +104,8 @@ class ObjectAPIView(generics.GenericAPIView):
         self.provider: Provider
         self.permission_classes = provider.permission_classes
         self.serializer_class = provider.serializer_class
-        self.additional_lookup_fields = self._compile_lookup_fields()
-        self.listing_filters = getattr(
-            provider,
-            "listing_filters",
-            getattr(provider, "listing_filter", {"id": int, "pk": int}),
-        )  # NOTE: better to have the following if after initial, but this is easier
-
-    def _compile_lookup_fields(self) -> Set[str]:
-        """
-        Compiles the additional lookup fields + the two required into one clean set.
-        """
-        allowed_fields: List = getattr(  # the lookup fields allowed for the provider
-            self.provider, "additional_lookup_fields", []
-        )
-        allowed_fields.extend(settings.GLOBAL_LOOKUPS)
-        return set(
-            allowed_fields
-        )  # use a set for better memory performance & no duplicates.
+        self.additional_lookup_fields = provider.lookup_fields
+        self.listing_filters = provider.listing_filters
 
     @property
     def lookup_field(self) -> str:
@@ -186,7 +133,7 @@ class ObjectAPIView(generics.GenericAPIView):
         lookup = lookup or settings.GLOBAL_LOOKUPS[0]
         if lookup not in self.additional_lookup_fields:
             raise BadRequest(
-                f"Invalid lookup field {lookup}. Valid fields are: {', '.join(self.additional_lookup_fields)}."
+                f"Invalid lookup field {lookup}. Valid fields are: {', '.join(sorted(self.additional_lookup_fields))}."
             )
 
     def get_object(self) -> Model | None:  # None if a 404 (obj not found)
@@ -288,6 +235,7 @@ class Provider(Protocol):
     kind: APIObjOperations
     listing_filters_ignore: List[str]
 
-    serializers: SplitDictResult
+    serializers: Mapping[str, BaseSerializer]
+    lookup_fields: FrozenSet[str]
 
     def __init__(self, request) -> None: ...
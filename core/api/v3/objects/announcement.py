@@ -148,6 +148,7 @@ class Inner(permissions.BasePermission):
 
 class AnnouncementProvider(BaseProvider):
     model = Announcement
+    ordering = ("-show_after",)
     listing_filters = {
         "tags": [(int, ""), (str, "name")],
         "organization": int,
@@ -1,6 +1,8 @@
 from abc import ABC
-from typing import Dict, Final, List, Tuple
+from types import MappingProxyType
+from typing import Dict, Final, FrozenSet, List, Mapping, Tuple
 
+from django.conf import settings
 from django.db.models.base import ModelBase
 from rest_framework.serializers import BaseSerializer
 
@@ -8,14 +10,37 @@ from core.utils.types import APIObjOperations
 
 type SerializerItems = Dict[str, BaseSerializer]
 
+OPERATIONS: Final[Tuple[str, ...]] = ("list", "new", "single", "retrieve")
+DEFAULT_LISTING_FILTERS: Final[Dict[str, type]] = {"id": int, "pk": int}
+
 
 class BaseProvider(ABC, object):
+    """
+    Subclasses are checked and compiled once, when they are defined:
+    the attributes below are frozen and what every request needs is precomputed from them.
+    """
+
     allow_list: bool = True  # Is the view able to list the model's objects. (e.g. /user would list all users
     allow_new: bool = True  # Is the provider able to create a new object.
     kind: APIObjOperations  # type of view
     listing_filters_ignore: List[str] = []
+    ordering: Tuple[str, ...] = ("id",)  # natural ordering, used by cursor pagination
     raw_serializers: SerializerItems
 
+    # compiled by __init_subclass__
+    serializers: Mapping[str, BaseSerializer]  # operation -> serializer
+    lookup_fields: FrozenSet[str]  # additional_lookup_fields + GLOBAL_LOOKUPS
+    ignored_query_params: FrozenSet[
+        str
+    ]  # IGNORED_QUERY_PARAMS + listing_filters_ignore
+    operations: Tuple[str, ...]
+    cursor_ordering: Tuple[str, ...]  # ordering + id, so that it is total
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._run_typechecking()
+        cls._compile()
+
     @property
     def serializer_class(self):
         return self.serializers.get(self.request.kind)
@@ -25,9 +50,11 @@ class BaseProvider(ABC, object):
         get_attrs: Final[str] = ("queryset",)
         required_attrs: Final[Dict[str, type]] = {
             "model": ModelBase,
-            "raw_serializers": dict,
+            "raw_serializers": (dict, MappingProxyType),
         }
-        additional_attrs: Final[Dict[str, type]] = {"additional_lookup_fields": list}
+        additional_attrs: Final[Dict[str, type]] = {
+            "additional_lookup_fields": (list, tuple)
+        }  # tuples and mapping proxies are what compiled providers hold
 
         for key in get_attrs:
             if not (
@@ -52,19 +79,54 @@ class BaseProvider(ABC, object):
     @classmethod
     def _check_serializers(cls):
         for key in cls.raw_serializers:
-            if key not in ("list", "new", "single", "retrieve", "_"):
+            if key not in OPERATIONS + ("_",):
                 raise AttributeError(
                     f"key {key} is not a valid key for raw_serializers"
                 )
 
-    def __new__(cls, request):
-        from core.api.utils.polymorphism import splitter
-
-        cls._run_typechecking()
-
-        instance = super().__new__(cls)
-        instance.serializers = splitter(cls.raw_serializers)
-        return instance
+    @classmethod
+    def _compile(cls):
+        raw = cls.raw_serializers
+        cls.serializers = MappingProxyType(
+            {
+                operation: raw.get(operation, raw.get("_"))
+                for operation in OPERATIONS
+                if operation in raw or "_" in raw
+            }
+        )
+        cls.operations = OPERATIONS if "_" in raw else tuple(raw)
+        cls.raw_serializers = MappingProxyType(dict(raw))
+
+        cls.additional_lookup_fields = tuple(
+            getattr(cls, "additional_lookup_fields", ())
+        )
+        cls.lookup_fields = frozenset(
+            cls.additional_lookup_fields + tuple(settings.GLOBAL_LOOKUPS)
+        )
+
+        cls.listing_filters_ignore = tuple(cls.listing_filters_ignore)
+        cls.ignored_query_params = frozenset(
+            tuple(settings.IGNORED_QUERY_PARAMS) + cls.listing_filters_ignore
+        )
+
+        listing_filters = getattr(
+            cls,
+            "listing_filters",
+            getattr(cls, "listing_filter", DEFAULT_LISTING_FILTERS),
+        )
+        # filters accepting several types are given as lists of (type, category)
+        cls.listing_filters = MappingProxyType(
+            {
+                key: tuple(value) if isinstance(value, list) else value
+                for key, value in listing_filters.items()
+            }
+        )
+
+        cls.ordering = tuple(cls.ordering)
+        cls.cursor_ordering = cls.ordering
+        if not {"id", "-id", "pk", "-pk"} & set(cls.ordering):
+            tie_break = "-id" if cls.ordering[0].startswith("-") else "id"
+            cls.cursor_ordering += (tie_break,)
 
     def __init__(self, request):
         self.request = request
@@ -73,6 +135,4 @@ class BaseProvider(ABC, object):
     def supported_operations(cls) -> Tuple[str]:
         if not issubclass(cls, BaseProvider):
             raise TypeError("This method can only be ran on subclasses of BaseProvider")
-        if "_" in cls.raw_serializers.keys():
-            return "list", "new", "single", "retrieve"
-        return tuple(cls.raw_serializers.keys())
+        return cls.operations
@@ -50,6 +50,7 @@ class Serializer(serializers.ModelSerializer):
 
 class BlogPostProvider(BaseProvider):
     model = BlogPost
+    ordering = ("-created_date",)
     additional_lookup_fields = ["slug"]
     raw_serializers = {"_": Serializer}
 
@@ -44,6 +44,7 @@ class DetailSerializer(serializers.ModelSerializer):
 
 class EventProvider(BaseProvider):
     model = Event
+    ordering = ("start_date",)
     listing_filters_ignore = ["start", "end"]
     raw_serializers = {
         "retrieve": DetailSerializer,
@@ -40,6 +40,7 @@ class Serializer(serializers.ModelSerializer):
 
 class ExhibitProvider(BaseProvider):
     model = Exhibit
+    ordering = ("-created_date",)
     additional_lookup_fields = ["slug"]
     raw_serializers = {"_": Serializer}
 
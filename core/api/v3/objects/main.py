@@ -2,7 +2,6 @@ from __future__ import annotations
 
 from typing import Callable, Dict, List, Tuple
 
-from django.conf import settings
 from django.core.exceptions import BadRequest, ObjectDoesNotExist
 from django.db.models import Model, QuerySet
 from django.http import JsonResponse, QueryDict
@@ -15,6 +14,7 @@ from core.api.utils.last_modified import (
     GenericAPIViewWithLastModified,
 )
 from core.api.utils.mixins import LookupField
+from core.api.utils.pagination import ObjectCursorPagination
 
 __all__ = ["ObjectList", "ObjectSingle", "ObjectRetrieve", "ObjectNew"]
 
@@ -75,10 +75,7 @@ class ObjectList(
         """
         k_filters = []
         for key, value in query_params.lists():
-            if (
-                key
-                in settings.IGNORED_QUERY_PARAMS + self.provider.listing_filters_ignore
-            ):
+            if key in self.provider.ignored_query_params:
                 continue
             if key not in self.listing_filters:
                 raise BadRequest(
@@ -107,7 +104,7 @@ class ObjectList(
                 raise BadRequest(
                     f'Invalid value for boolean filter: {lookup_value}. Accepted values for True are {" or ".join(self.TRUE_VALUES)} and for False they are {" or ".join(self.FALSE_VALUES)}'
                 )
-        if isinstance(lookup_type, list):
+        if isinstance(lookup_type, tuple):
             """
             there are multiple types that are accepted for this filter. See which one matches.
             """
@@ -167,6 +164,8 @@ class ObjectList(
         allow_list = getattr(self.provider, "allow_list", True)
         if not allow_list:
             return JsonResponse({"detail": "listing not allowed"}, status=422)
+        if ObjectCursorPagination.cursor_query_param in request.query_params:
+            self.pagination_class = ObjectCursorPagination
         response = super().get(self, request, *args, **kwargs)
         if response.data["next"]:
             response.data["next"] = response.data["next"].replace("http://", "https://")
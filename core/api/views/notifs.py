@@ -1,23 +1,44 @@
-import json
-from queue import LifoQueue
+import asyncio
+import os
+from collections import deque
 
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.db.models import signals
-from django.dispatch import Signal, receiver
+from django.dispatch import receiver
 from django.http import StreamingHttpResponse
-from rest_framework import permissions, response
+from rest_framework import permissions, renderers, response
 from rest_framework import serializers as serializers2
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from ... import models, tasks
 from .. import serializers
+from ..utils.notif_stream import (
+    HEARTBEAT,
+    INIT_EVENT,
+    OVERFLOW,
+    get_broker,
+    get_hub,
+    metrics,
+)
 
-global_notifs = Signal()
+
+def publish(event_name, instance):
+    """
+    Serializes instance and publishes it to the notification streams of every worker once the transaction commits.
+    Publishing is best-effort: a failure is logged and does not affect the request that saved instance.
+    """
+    transaction.on_commit(
+        lambda: get_broker().publish(*serializer(event_name, instance=instance)),
+        robust=True,
+    )
 
 
 @receiver(signals.post_save, sender=models.Announcement)
 def announcement_change(sender, **kwargs):
-    global_notifs.send("announcement_change", orig_sender=sender, kwargs=kwargs)
+    publish("announcement_change", kwargs["instance"])
     if not kwargs["created"]:
         return  # only send notifs on new announcements
 
@@ -32,73 +53,146 @@ def blogpost_change(sender, **kwargs):
     if not kwargs["created"]:
         return  # only send notifs on new blogposts
 
-    global_notifs.send("blogpost_change", orig_sender=sender, kwargs=kwargs)
+    publish("blogpost_change", kwargs["instance"])
     if not settings.NOTIF_DRY_RUN:
         tasks.notif_broker_blogpost.delay(kwargs["instance"].id)
 
 
 class NotificationStream:
-    def __init__(
-        self,
-        signal,
-        serializer,
-    ):
-        self.signal = signal
-        self.serializer = serializer
-        self.q = LifoQueue()
-        self.__setup()
-
-    def __setup(self):
-        self.signal.connect(self.__receive)
-        self.q.put(("init", {}))
+    """
+    Blocking stream of notification events, for WSGI.
+    Events retained after last_event_id are replayed first, and a heartbeat is sent whenever the stream is idle
+    for NOTIF_STREAM_HEARTBEAT_SECS.
+    """
 
-    def __del__(self):
-        self.signal.disconnect(self.__receive)
+    def __init__(self, broker, last_event_id=None):
+        # subscribe before replaying, so nothing published in between is missed
+        self.subscription = broker.subscribe()
+        self.pending = deque([INIT_EVENT])
+        self.replayed_up_to = None
+        if last_event_id is not None:
+            self.pending.extend(broker.replay(last_event_id))
+            self.replayed_up_to = self.pending[-1].id
+        metrics.stream_opened()
+        self.closed = False
+
+    def close(self):
+        # called by StreamingHttpResponse when the client goes away
+        if not self.closed:
+            self.closed = True
+            self.subscription.close()
+            metrics.stream_closed()
 
-    def __receive(self, sender, **kwargs):
-        self.q.put((sender, kwargs))
+    def __del__(self):
+        self.close()
 
     def __iter__(self):
         return self
 
-    def __next__(self):
-        sender, kwargs = self.q.get()
-        event_name, data = self.serializer(sender, **kwargs)
-        return f"event: {event_name}\n" f"data: {json.dumps(data)}\n"
+    def __next__(self) -> bytes:
+        if self.pending:
+            return self.pending.popleft().frame
+        while True:
+            event = self.subscription.get(timeout=settings.NOTIF_STREAM_HEARTBEAT_SECS)
+            if event is None:
+                return HEARTBEAT
+            if self.replayed_up_to is None or event.id > self.replayed_up_to:
+                return event.frame
 
 
-def serializer(sender, signal=None, orig_sender=None, kwargs=None):
-    if kwargs is None:
-        kwargs = {}
+async def async_notification_stream(broker, last_event_id=None):
+    """
+    The coroutine version of NotificationStream, for ASGI.
+    """
+    hub = get_hub(broker)
+    stream_queue = hub.subscribe()
+    metrics.stream_opened()
+    try:
+        yield INIT_EVENT.frame
+        replayed_up_to = None
+        if last_event_id is not None:
+            # subscribe before replaying, so nothing published in between is missed
+            await hub.subscribed()
+            for event in await asyncio.to_thread(broker.replay, last_event_id):
+                replayed_up_to = event.id
+                yield event.frame
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    stream_queue.get(), settings.NOTIF_STREAM_HEARTBEAT_SECS
+                )
+            except TimeoutError:
+                yield HEARTBEAT
+                continue
+            if event is OVERFLOW:
+                return
+            if replayed_up_to is None or event.id > replayed_up_to:
+                yield event.frame
+    finally:
+        hub.unsubscribe(stream_queue)
+        metrics.stream_closed()
+
+
+def serializer(sender, instance=None):
     if sender == "announcement_change":
-        return (
-            sender,
-            serializers.AnnouncementSerializer(kwargs["instance"]).data,
-        )
+        data = serializers.AnnouncementSerializer(instance).data
     elif sender == "blogpost_change":
-        return (
-            sender,
-            serializers.BlogPostSerializer(kwargs["instance"]).data,
-        )
+        data = serializers.BlogPostSerializer(instance).data
     else:
-        return sender, kwargs
+        data = {}
+    return sender, data
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    # lets EventSource clients, which only accept text/event-stream, through content negotiation
+    media_type = "text/event-stream"
+    format = "event-stream"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
 
 
 class NotificationsNew(APIView):
+    """
+    Server-sent events for new announcements and blog posts.
+    Under ASGI each connection is a coroutine; under WSGI it falls back to a blocking NotificationStream.
+    Clients resume with the Last-Event-ID header (or the lastEventId query parameter).
+    """
+
     permission_classes = [permissions.AllowAny]
+    renderer_classes = [EventStreamRenderer, *api_settings.DEFAULT_RENDERER_CLASSES]
 
     def get(self, request, format=None):
-        res = StreamingHttpResponse(
-            NotificationStream(
-                signal=global_notifs,
-                serializer=serializer,
-            ),
-            content_type="text/event-stream",
+        last_event_id = request.headers.get("Last-Event-ID") or request.GET.get(
+            "lastEventId"
         )
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+        broker = get_broker()
+        # DRF views are sync, but the response is streamed by the server: under ASGI, on its event loop
+        if isinstance(request._request, ASGIRequest):
+            stream = async_notification_stream(broker, last_event_id)
+        else:
+            stream = NotificationStream(broker, last_event_id)
+        res = StreamingHttpResponse(stream, content_type="text/event-stream")
         res["Cache-Control"] = "no-cache"
+        res["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
         return res
 
 
+class NotificationStreamStats(APIView):
+    """
+    Counters of the notification streams of the worker process that answers.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        return response.Response(dict(metrics.snapshot(), pid=os.getpid()))
+
+
 class TokenSerializer(serializers2.Serializer):
     expo_push_token = serializers2.CharField()
     options = serializers2.DictField(allow_empty=True)
@@ -127,15 +221,12 @@ class NotifToken(APIView):
         s = TokenSerializer(data=request.data)
         s.is_valid(raise_exception=True)
         token = self._normalize_token(s.validated_data["expo_push_token"])
-        request.user.expo_notif_tokens[token] = s.validated_data["options"]
-        request.user.save()
+        models.PushToken.register(request.user, token, s.validated_data["options"])
         return response.Response(None)
 
     def delete(self, request, format=None):
         s = TokenSerializer(data=request.data)
         s.is_valid(raise_exception=True)
         token = self._normalize_token(s.validated_data["expo_push_token"])
-        if token in request.user.expo_notif_tokens:
-            del request.user.expo_notif_tokens[token]
-        request.user.save()
+        request.user.push_tokens.filter(token=token).delete()
         return response.Response(None)
@@ -57,10 +57,46 @@ class TermScheduleWeek(APIView):
 
         return Response(
             {
-                target_date.isoformat(): term.day_schedule(target_date=target_date)
-                for target_date in [
-                    date + datetime.timedelta(days=days) for days in range(7)
-                ]
+                target_date.isoformat(): schedule
+                for target_date, schedule in term.day_schedule_range(
+                    date, date + datetime.timedelta(days=6)
+                ).items()
+            }
+        )
+
+
+class TermScheduleRange(APIView):
+    """
+    Returns the schedule of every day from ?start= to ?end= (inclusive, YYYY-MM-DD).
+    """
+
+    MAX_DAYS = 62
+
+    @classmethod
+    def get(cls, request, pk, fmt=None):
+        term = get_object_or_404(models.Term, pk=pk)
+        start_date = parse_date_query_param(request, "start")
+        end_date = parse_date_query_param(request, "end")
+
+        if start_date is None or end_date is None:
+            return Response(
+                {"detail": "start and end must be dates of the form YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 0 <= (end_date - start_date).days < cls.MAX_DAYS:
+            return Response(
+                {
+                    "detail": f"end must be on or after start and within {cls.MAX_DAYS} days of it"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                target_date.isoformat(): schedule
+                for target_date, schedule in term.day_schedule_range(
+                    start_date, end_date
+                ).items()
             }
         )
 
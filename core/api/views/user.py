@@ -58,10 +58,10 @@ class UserMeScheduleWeek(APIView):
 
         return Response(
             {
-                target_date.isoformat(): request.user.schedule(target_date=target_date)
-                for target_date in [
-                    date + datetime.timedelta(days=days) for days in range(7)
-                ]
+                target_date.isoformat(): schedule
+                for target_date, schedule in request.user.schedule_range(
+                    date, date + datetime.timedelta(days=6)
+                ).items()
             }
         )
 
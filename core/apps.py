@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = "core"
+
+    def ready(self):
+        from .utils.timetable_formats import load_timetable_formats
+
+        load_timetable_formats()
@@ -303,7 +303,7 @@ class AnnouncementSupervisorAdminForm(forms.ModelForm):
 
 
 class UserAdminForm(CaseInsensitiveUsernameMixin, ContribUserChangeForm):
-    expo_notif_tokens = forms.JSONField(required=False)
+    pass
 
 
 class UserCreationAdminForm(CaseInsensitiveUsernameMixin, ContribAdminUserCreationForm):
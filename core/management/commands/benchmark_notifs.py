@@ -0,0 +1,181 @@
+"""
+Measures the throughput of the notification pipeline against a local stand-in for Expo.
+
+--users fake users, each with --tokens push tokens, are created inside a transaction that is rolled back afterwards.
+A broadcast is then split into chunks like fan_out does, and every chunk is delivered with deliver_batch
+(the body of the notif_batch task) over HTTP, retrying failed recipients immediately up to --max-retries times.
+Unless --expo-url is given, a FakeExpoServer is started on a free port with the injection options below.
+"""
+
+import datetime
+import itertools
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core import tasks
+from core.models import PendingPushReceipt, PushToken, User
+from core.utils.fake_expo import (
+    FakeExpoServer,
+    add_fake_expo_arguments,
+    fake_expo_from_options,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Command(BaseCommand):
+    help = "Sends a synthetic broadcast to fake users through a local Expo stand-in and reports its throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", "-n", type=int, default=1000)
+        parser.add_argument(
+            "--tokens", type=int, default=1, help="Push tokens per user."
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.NOTIF_FANOUT_CHUNK_SIZE,
+            help="Users per notif_batch task.",
+        )
+        parser.add_argument(
+            "--max-retries", type=int, default=tasks.notif_batch.max_retries
+        )
+        parser.add_argument("--category", default="ann.public")
+        parser.add_argument(
+            "--receipts",
+            action="store_true",
+            help="Also reconcile the push receipts of the broadcast.",
+        )
+        parser.add_argument(
+            "--expo-url",
+            help="Use an already running stand-in (see fake_expo_server) instead of starting one.",
+        )
+        add_fake_expo_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = None
+        expo_url = options["expo_url"]
+        if expo_url is None:
+            server = FakeExpoServer(
+                fake_expo_from_options(
+                    options, timeout_delay=settings.NOTIF_EXPO_TIMEOUT_SECS + 1
+                )
+            )
+            server.start()
+            expo_url = server.url
+
+        request_latencies = []
+
+        def record_latency(response, *args, **kwargs):
+            request_latencies.append(response.elapsed.total_seconds())
+
+        tasks.session.hooks["response"].append(record_latency)
+        try:
+            with override_settings(
+                NOTIFICATIONS_ENABLED=True,
+                NOTIF_DRY_RUN=False,
+                NOTIF_EXPO_HOST=expo_url,
+                NOTIF_RECEIPT_DELAY=datetime.timedelta(0),
+            ):
+                with transaction.atomic():
+                    self.benchmark(options, request_latencies)
+                    raise Rollback
+        except Rollback:
+            pass
+        finally:
+            tasks.session.hooks["response"].remove(record_latency)
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    def benchmark(self, options, request_latencies):
+        users = User.objects.bulk_create(
+            User(username=f"notifbench-{i}") for i in range(options["users"])
+        )
+        PushToken.objects.bulk_create(
+            PushToken(user=user, token=f"{user.username}-{j}")
+            for user in users
+            for j in range(options["tokens"])
+        )
+        token_count = len(users) * options["tokens"]
+        msg_kwargs = dict(
+            title="Synthetic broadcast",
+            body="Load test",
+            category=options["category"],
+        )
+
+        ids = (
+            tasks.users_with_token(options["category"])
+            .filter(username__startswith="notifbench-")
+            .values_list("id", flat=True)
+            .order_by("id")
+            .iterator(chunk_size=options["chunk_size"])
+        )
+        task_latencies = []
+        retries = failed_tokens = 0
+        start = time.perf_counter()
+        while chunk := list(itertools.islice(ids, options["chunk_size"])):
+            task_start = time.perf_counter()
+            token_ids = None
+            for attempt in itertools.count():
+                retry_ids, _error = tasks.deliver_batch(chunk, msg_kwargs, token_ids)
+                if not retry_ids:
+                    break
+                if attempt == options["max_retries"]:
+                    failed_tokens += len(retry_ids)
+                    break
+                retries += 1
+                token_ids = sorted(retry_ids)
+            task_latencies.append(time.perf_counter() - task_start)
+        elapsed = time.perf_counter() - start
+
+        accepted = PendingPushReceipt.objects.filter(push_token__user__in=users).count()
+        remaining = PushToken.objects.filter(user__in=users).count()
+        send_latencies = list(request_latencies)
+
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                f"{len(users)} users, {token_count} tokens, {len(task_latencies)} tasks"
+            )
+        )
+        self.stdout.write(f"elapsed            {elapsed:.2f}s")
+        self.stdout.write(f"messages accepted  {accepted}")
+        self.stdout.write(f"messages/sec       {accepted / elapsed:.1f}")
+        self.stdout.write(f"requests           {len(send_latencies)} answered")
+        self.stdout.write(f"task retries       {retries}")
+        self.stdout.write(f"tokens given up on {failed_tokens}")
+        self.stdout.write(f"tokens rejected    {token_count - remaining}")
+        self.write_percentiles("request latency", send_latencies)
+        self.write_percentiles("task latency", task_latencies)
+
+        if options["receipts"]:
+            start = time.perf_counter()
+            tasks.reconcile_push_receipts()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"receipts           {elapsed:.2f}s, "
+                f"{PendingPushReceipt.objects.filter(push_token__user__in=users).count()} left unchecked, "
+                f"{remaining - PushToken.objects.filter(user__in=users).count()} tokens pruned"
+            )
+
+    def write_percentiles(self, name, values):
+        self.stdout.write(
+            f"{name:<19}"
+            + "  ".join(
+                f"p{p} {percentile(values, p) * 1000:.1f}ms" for p in (50, 90, 99)
+            )
+            + f"  max {max(values, default=0) * 1000:.1f}ms"
+        )
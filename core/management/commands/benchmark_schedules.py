@@ -0,0 +1,268 @@
+"""
+Benchmarks the schedule paths against a realistic, seeded school year.
+
+For every timetable format, a term running from September to June is seeded with a winter break, a March break,
+PA days and a few events for every special schedule format of that timetable format (late starts, early dismissals, ...),
+along with --timetables students who each have a full timetable.
+Everything is created inside a transaction that is rolled back afterwards, so run it against a development database.
+The cache versions of the seeded term and timetables are deleted too, as their pks will be reused.
+
+Each path is measured at early, mid and late term dates, both cold (term cache invalidated) and warm,
+reporting wall time and query counts. The cost of the uncached paths grows with how far the date is into the term.
+"""
+
+import datetime
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.api.views import TermScheduleRange, TermScheduleWeek, UserMeScheduleWeek
+from core.models import Course, Event, Organization, Term, Timetable, User
+from core.models.course import TERM_CACHE_VERSION_KEY
+from core.models.timetable import TIMETABLE_COURSES_VERSION_KEY
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmarks Term, Timetable and User schedules and the schedule endpoints over a seeded school year."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            "-f",
+            action="append",
+            dest="formats",
+            help="Timetable format to benchmark (repeatable). Defaults to every format in TIMETABLE_FORMATS.",
+        )
+        parser.add_argument(
+            "--timetables",
+            "-n",
+            type=int,
+            default=2000,
+            help="Number of students (each with one timetable) to seed.",
+        )
+        parser.add_argument(
+            "--repeat",
+            "-r",
+            type=int,
+            default=5,
+            help="Number of warm runs per measurement; the median is reported.",
+        )
+        parser.add_argument(
+            "--year",
+            type=int,
+            default=2099,
+            help="The school year starts in September of this year. Pick one without real terms.",
+        )
+        parser.add_argument("--seed", type=int, default=2024)
+
+    def handle(self, *args, **options):
+        formats = options["formats"] or list(settings.TIMETABLE_FORMATS)
+        for timetable_format in formats:
+            self.cache_keys = []
+            try:
+                with transaction.atomic():
+                    self.benchmark_format(timetable_format, options)
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                # version keys never expire, and would be picked up by the next term or timetable with the same pk
+                cache.delete_many(self.cache_keys)
+
+    def benchmark_format(self, timetable_format, options):
+        rng = random.Random(options["seed"])
+        term, students = self.seed(timetable_format, options, rng)
+        length = (term.end_date - term.start_date).days
+        instructional_days = sum(1 for day in term.instructional_calendar() if day)
+
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                f"{timetable_format}: {term.start_date} to {term.end_date}, "
+                f"{instructional_days} instructional days, {len(students)} timetables"
+            )
+        )
+        self.stdout.write(
+            f"{'path':<32}{'date':<12}{'cold ms':>10}{'queries':>9}{'warm ms':>10}{'queries':>9}"
+        )
+
+        timetables = list(
+            Timetable.objects.filter(term=term)
+            .select_related("term", "owner")
+            .prefetch_related("courses")
+        )
+        timetable = timetables[0]
+        user = timetable.owner
+        factory = APIRequestFactory()
+
+        def endpoint(view, path, **kwargs):
+            def call(target_date):
+                request = factory.get(path, {"date": target_date.isoformat()})
+                force_authenticate(request, user=user)
+                return view.as_view()(request, **kwargs).render()
+
+            return call
+
+        def month_endpoint(target_date):
+            request = factory.get(
+                f"/api/term/{term.pk}/schedule/range",
+                {
+                    "start": target_date.isoformat(),
+                    "end": (target_date + datetime.timedelta(days=30)).isoformat(),
+                },
+            )
+            return TermScheduleRange.as_view()(request, pk=term.pk).render()
+
+        paths = {
+            "Term.day_num": lambda target_date: term.day_num(target_date),
+            "Term.day_schedule": lambda target_date: term.day_schedule(target_date),
+            "Timetable.day_schedule": lambda target_date: timetable.day_schedule(
+                target_date
+            ),
+            f"Timetable.day_schedule x{len(timetables)}": lambda target_date: [
+                t.day_schedule(target_date) for t in timetables
+            ],
+            "User.schedule": lambda target_date: user.schedule(target_date),
+            "GET term/<pk>/schedule/week": endpoint(
+                TermScheduleWeek, f"/api/term/{term.pk}/schedule/week", pk=term.pk
+            ),
+            "GET me/schedule/week": endpoint(
+                UserMeScheduleWeek, "/api/me/schedule/week"
+            ),
+            "GET term/<pk>/schedule/range": month_endpoint,
+        }
+        dates = {
+            "early": term.start_date + datetime.timedelta(days=7),
+            "mid": term.start_date + datetime.timedelta(days=length // 2),
+            "late": term.end_date - datetime.timedelta(days=7),
+        }
+
+        for name, path in paths.items():
+            for label, target_date in dates.items():
+                Term.invalidate_cache(term.pk)
+                cold_ms, cold_queries = self.measure(path, target_date)
+                warm = [
+                    self.measure(path, target_date) for _ in range(options["repeat"])
+                ]
+                warm_ms = statistics.median(ms for ms, _ in warm)
+                warm_queries = max(queries for _, queries in warm)
+                self.stdout.write(
+                    f"{name:<32}{label:<12}{cold_ms:>10.2f}{cold_queries:>9}{warm_ms:>10.2f}{warm_queries:>9}"
+                )
+
+    @staticmethod
+    def measure(path, target_date):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            path(target_date)
+            elapsed = time.perf_counter() - start
+        return elapsed * 1000, len(queries)
+
+    def seed(self, timetable_format, options, rng):
+        config = settings.TIMETABLE_FORMATS[timetable_format]
+        year = options["year"]
+        labour_day = datetime.date(year, 9, 1)
+        while labour_day.weekday() != 0:
+            labour_day += datetime.timedelta(days=1)
+        start_date = labour_day + datetime.timedelta(days=1)
+        term = Term.objects.create(
+            name=f"Benchmark {timetable_format}",
+            timetable_format=timetable_format,
+            start_date=start_date,
+            end_date=datetime.date(year + 1, 6, 27),
+        )
+        self.cache_keys.append(TERM_CACHE_VERSION_KEY.format(term.pk))
+
+        owner = User.objects.create(username=f"benchmark-{timetable_format}")
+        org = Organization.objects.create(
+            owner=owner, name="Benchmark", slug=f"benchmark-{timetable_format}"
+        )
+
+        def add_event(name, day, days=1, schedule_format="default"):
+            start = datetime.datetime.combine(day, datetime.time())
+            return Event.objects.create(
+                name=name,
+                term=term,
+                organization=org,
+                start_date=start,
+                end_date=start + datetime.timedelta(days=days, seconds=-1),
+                schedule_format=schedule_format,
+            )
+
+        weekdays = [
+            start_date + datetime.timedelta(days=offset)
+            for offset in range((term.end_date - start_date).days)
+            if (start_date + datetime.timedelta(days=offset)).weekday() < 5
+        ]
+        special_days = iter(rng.sample(weekdays, 40))
+
+        schedules = config["schedules"]
+        closed_format = next(
+            (name for name, periods in schedules.items() if not periods), None
+        )
+        closures = [
+            add_event("Winter Break", datetime.date(year, 12, 23), days=14),
+            add_event("March Break", datetime.date(year + 1, 3, 16), days=7),
+            *(add_event("PA Day", next(special_days)) for _ in range(6)),
+        ]
+        if closed_format is not None:
+            Event.objects.filter(id__in=[e.id for e in closures]).update(
+                schedule_format=closed_format
+            )
+        # formats without a non-instructional schedule still get their closures
+        Event.objects.filter(id__in=[e.id for e in closures]).update(
+            is_instructional=False
+        )
+        for schedule_format, periods in schedules.items():
+            if schedule_format == "default" or not periods:
+                continue
+            for _ in range(4):
+                add_event(
+                    schedule_format,
+                    next(special_days),
+                    schedule_format=schedule_format,
+                )
+        Term.invalidate_cache(term.pk)
+
+        positions = sorted(config["positions"])
+        courses = Course.objects.bulk_create(
+            Course(code=f"BM{position}{section:02}", term=term, position=position)
+            for position in positions
+            for section in range(20)
+        )
+        courses_by_position = {}
+        for course in courses:
+            courses_by_position.setdefault(course.position, []).append(course)
+
+        students = User.objects.bulk_create(
+            User(username=f"benchmark-{timetable_format}-{i}")
+            for i in range(options["timetables"])
+        )
+        timetables = Timetable.objects.bulk_create(
+            Timetable(owner=student, term=term) for student in students
+        )
+        self.cache_keys.extend(
+            TIMETABLE_COURSES_VERSION_KEY.format(timetable.pk)
+            for timetable in timetables
+        )
+        Timetable.courses.through.objects.bulk_create(
+            Timetable.courses.through(
+                timetable_id=timetable.id,
+                course_id=rng.choice(courses_by_position[position]).id,
+            )
+            for timetable in timetables
+            for position in rng.sample(
+                positions, min(config["courses"], len(positions))
+            )
+        )
+        return term, students
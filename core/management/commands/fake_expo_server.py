@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.utils.fake_expo import (
+    FakeExpoServer,
+    add_fake_expo_arguments,
+    fake_expo_from_options,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the Expo push service with latency and error injection. "
+        "Set NOTIF_EXPO_HOST to the printed URL to send notifications to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+        add_fake_expo_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = FakeExpoServer(
+            fake_expo_from_options(options), host=options["host"], port=options["port"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fake Expo listening on {server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            expo = server.expo
+            self.stdout.write(
+                f"{len(expo.requests)} requests, {len(expo.sent)} messages accepted"
+            )
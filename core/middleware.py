@@ -1,11 +1,14 @@
 from urllib.parse import urlparse
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django import http
 from django.conf import settings
 from django.contrib.redirects.middleware import RedirectFallbackMiddleware
 from django.contrib.redirects.models import Redirect
 from django.contrib.sites.shortcuts import get_current_site
 
+from .models import Term
+
 
 class CustomRedirectFallbackTemporaryMiddleware(RedirectFallbackMiddleware):
     response_gone_class = http.HttpResponseGone
@@ -61,3 +64,28 @@ class CustomRedirectFallbackTemporaryMiddleware(RedirectFallbackMiddleware):
             return self.response_redirect_class(r.new_path)
 
         return response
+
+
+class CurrentTermMemoMiddleware:
+    """
+    Memoizes Term.get_current for the duration of each request.
+    The memo is a context variable, so under ASGI it also reaches sync views run in a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with Term.memoize_current():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with Term.memoize_current():
+            return await self.get_response(request)
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0073_dailyannouncement_alter_event_is_instructional_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(help_text='Expo push token, without the ExponentPushToken[...] wrapper.', max_length=255)),
+                ('options', models.JSONField(blank=True, help_text='Options as submitted by the app.', null=True)),
+                ('allow_all', models.BooleanField(default=True, help_text='Whether every category is allowed. Otherwise, only the allowed categories are.')),
+                ('last_success', models.DateTimeField(blank=True, null=True)),
+                ('failure_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='push_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PushTokenCategory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=64)),
+                ('push_token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allowed_categories', to='core.pushtoken')),
+            ],
+            options={
+                'verbose_name_plural': 'push token categories',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pushtoken',
+            index=models.Index(fields=['token'], name='core_pushto_token_0f2157_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pushtoken',
+            constraint=models.UniqueConstraint(fields=('user', 'token'), name='unique_push_token_user_and_token'),
+        ),
+        migrations.AddIndex(
+            model_name='pushtokencategory',
+            index=models.Index(fields=['category', 'push_token'], name='core_pushto_categor_971cbf_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pushtokencategory',
+            constraint=models.UniqueConstraint(fields=('push_token', 'category'), name='unique_push_token_category'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def tokens_to_rows(apps, schema_editor):
+    User = apps.get_model("core", "User")
+    PushToken = apps.get_model("core", "PushToken")
+    PushTokenCategory = apps.get_model("core", "PushTokenCategory")
+
+    users = User.objects.exclude(expo_notif_tokens={}).only("id", "expo_notif_tokens")
+    for user in users.iterator():
+        for token, options in (user.expo_notif_tokens or {}).items():
+            allowlist = options.get("allow") if isinstance(options, dict) else None
+            allow_all = not isinstance(allowlist, dict)
+            push_token = PushToken.objects.create(
+                user=user, token=token, options=options, allow_all=allow_all
+            )
+            if not allow_all:
+                PushTokenCategory.objects.bulk_create(
+                    PushTokenCategory(push_token=push_token, category=category)
+                    for category in allowlist
+                )
+
+
+def rows_to_tokens(apps, schema_editor):
+    User = apps.get_model("core", "User")
+    PushToken = apps.get_model("core", "PushToken")
+
+    tokens = {}
+    for user_id, token, options in PushToken.objects.values_list(
+        "user_id", "token", "options"
+    ).iterator():
+        tokens.setdefault(user_id, {})[token] = options
+    for user_id, user_tokens in tokens.items():
+        User.objects.filter(id=user_id).update(expo_notif_tokens=user_tokens)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0074_pushtoken"),
+    ]
+
+    operations = [
+        migrations.RunPython(tokens_to_rows, rows_to_tokens),
+    ]
@@ -0,0 +1,14 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0075_migrate_expo_notif_tokens"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="user",
+            name="expo_notif_tokens",
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0076_remove_user_expo_notif_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushDeliveryStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('sent', models.PositiveIntegerField(default=0, help_text='Messages accepted by Expo.')),
+                ('delivered', models.PositiveIntegerField(default=0, help_text='Messages with a successful push receipt.')),
+                ('failed', models.PositiveIntegerField(default=0, help_text='Messages that failed for any reason other than an unregistered device.')),
+                ('unregistered', models.PositiveIntegerField(default=0, help_text='Messages to tokens that are no longer registered.')),
+                ('expired', models.PositiveIntegerField(default=0, help_text='Messages whose push receipt never became available.')),
+            ],
+            options={
+                'verbose_name_plural': 'push delivery stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='PendingPushReceipt',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket_id', models.CharField(max_length=64, unique=True)),
+                ('sent_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('push_token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_receipts', to='core.pushtoken')),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.5 on 2026-10-18 10:00
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_imported(apps, schema_editor):
+    # rows imported before source_hash existed are hashed like fetch_announcements does, so they are not imported again
+    DailyAnnouncement = apps.get_model("core", "DailyAnnouncement")
+    seen = set()
+    hashed = []
+    for announcement in DailyAnnouncement.objects.order_by("id").iterator():
+        source_hash = hashlib.sha256(
+            "\x1f".join(
+                (
+                    announcement.organization,
+                    announcement.start_date.isoformat(),
+                    announcement.end_date.isoformat(),
+                    announcement.content,
+                )
+            ).encode()
+        ).hexdigest()
+        if source_hash in seen:
+            continue
+        seen.add(source_hash)
+        announcement.source_hash = source_hash
+        hashed.append(announcement)
+    DailyAnnouncement.objects.bulk_update(hashed, ["source_hash"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0077_push_receipts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyannouncement',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(hash_imported, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,43 @@
 from __future__ import annotations
 
+import contextlib
+import contextvars
+import copy
 import datetime as dt
+import uuid
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned, ValidationError
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from .. import utils
 
+TERM_CACHE_VERSION_KEY = "term_cache_version:{}"
+TERM_CALENDAR_CACHE_KEY = "term_calendar:{}:{}"  # term id, cache version
+TERM_DAY_CACHE_KEY = "term_day:{}:{}:{}"  # term id, cache version, date
+TERM_EVENTS_CACHE_KEY = "term_events:{}:{}"  # term id, cache version
+TERM_CACHE_TIMEOUT = 60 * 60 * 24
+CURRENT_TERM_VERSION_KEY = "current_term_version"
+
+
+def _to_query_date(target_date=None) -> dt.date:
+    """
+    Converts target_date to the date a DateField lookup would compare it as.
+    """
+    target_date = utils.get_localdate(date=target_date)
+    if isinstance(target_date, dt.datetime):
+        if timezone.is_aware(target_date):
+            target_date = timezone.make_naive(
+                target_date, timezone.get_default_timezone()
+            )
+        return target_date.date()
+    return target_date
+
 
 class Term(models.Model):
     name = models.CharField(max_length=128)
@@ -35,117 +63,251 @@ class Term(models.Model):
         return self.start_date <= target_date < self.end_date
 
     def day_is_instructional(self, target_date=None):
-        target_date_start = utils.get_localdate(date=target_date, time=[0, 0, 0])
-        target_date_end = utils.get_localdate(date=target_date, time=[23, 59, 59])
-        return (
-            target_date.weekday() < 5
-            and not self.events.filter(
-                is_instructional=False,
-                start_date__lt=target_date_end,
-                end_date__gt=target_date_start,
-            ).exists()
+        target_date = utils.to_date(target_date)
+        if self.is_current(target_date):
+            return self.instructional_calendar()[self.__day_offset(target_date)] > 0
+
+        _events, closures = self.event_index()
+        return target_date.weekday() < 5 and not closures.count(
+            utils.get_localdate(date=target_date, time=[0, 0, 0]),
+            utils.get_localdate(date=target_date, time=[23, 59, 59]),
+            strict=True,
         )
 
     def day_num(self, target_date=None):
-        tf = settings.TIMETABLE_FORMATS[self.timetable_format]
+        target_date = utils.to_date(target_date)
+        if not self.is_current(target_date):
+            return None
+        return self.instructional_calendar()[self.__day_offset(target_date)] or None
+
+    def __day_offset(self, target_date):
+        return (target_date - utils.to_date(self.start_date)).days
+
+    def instructional_calendar(self) -> bytes:
+        """
+        Returns the cycle day number of every date in the term, indexed by the number of days since start_date.
+        Non-instructional days are 0.
+        The calendar is cached until an event of this term (or the term itself) changes.
+        """
+        key = TERM_CALENDAR_CACHE_KEY.format(self.pk, self.cache_version())
+        calendar = cache.get(key)
+        if calendar is None:
+            calendar = self.__build_instructional_calendar()
+            cache.set(key, calendar, TERM_CACHE_TIMEOUT)
+        return calendar
+
+    def cache_version(self) -> str:
+        return cache.get_or_set(
+            TERM_CACHE_VERSION_KEY.format(self.pk), lambda: uuid.uuid4().hex, None
+        )
+
+    @classmethod
+    def invalidate_cache(cls, term_id):
+        """
+        Invalidates the cached calendar and day schedules of a term by moving it to a new cache version.
+        """
+        cache.set(TERM_CACHE_VERSION_KEY.format(term_id), uuid.uuid4().hex, None)
+
+    def event_index(self) -> tuple[utils.IntervalIndex, utils.IntervalIndex]:
+        """
+        Returns interval indexes of the schedule formats of every event of the term and of its non-instructional events.
+        Both are loaded in one query and cached until an event of this term (or the term itself) changes.
+        """
+        version = self.cache_version()
+        memo = getattr(self, "_event_index", None)
+        if memo is not None and memo[0] == version:
+            return memo[1]
+
+        key = TERM_EVENTS_CACHE_KEY.format(self.pk, version)
+        index = cache.get(key)
+        if index is None:
+            events = list(
+                self.events.values_list(
+                    "start_date", "end_date", "schedule_format", "is_instructional"
+                )
+            )
+            index = (
+                utils.IntervalIndex(
+                    (start, end, schedule_format)
+                    for start, end, schedule_format, _is_instructional in events
+                ),
+                utils.IntervalIndex(
+                    (start, end, None)
+                    for start, end, _schedule_format, is_instructional in events
+                    if not is_instructional
+                ),
+            )
+            cache.set(key, index, TERM_CACHE_TIMEOUT)
+        self._event_index = (version, index)
+        return index
+
+    @property
+    def compiled_format(self) -> utils.TimetableFormat:
+        return utils.get_timetable_format(self.timetable_format)
+
+    def __build_instructional_calendar(self) -> bytes:
+        tf = self.compiled_format
         methods = {
             "consecutive": self.__day_num_consecutive,
             "calendar_days": self.__day_num_calendar_days,
         }
-        target_date = utils.get_localdate(date=target_date, time=[23, 59, 59])
-        if not self.is_current(target_date.date()) or not self.day_is_instructional(
-            target_date
-        ):
-            return None
-        return methods[tf.get("day_num_method", "consecutive")](tf, target_date)
+        day_num_method = methods[tf.day_num_method]
+
+        _events, closures = self.event_index()
+        start_date = utils.to_date(self.start_date)
+        calendar = bytearray(max((utils.to_date(self.end_date) - start_date).days, 0))
+        seen_cycle_days = set()
+
+        for offset in range(len(calendar)):
+            cur_date = start_date + dt.timedelta(offset)
+            if cur_date.weekday() >= 5:
+                continue
+            day_start = utils.get_localdate(date=cur_date, time=[0, 0, 0])
+            day_end = utils.get_localdate(date=cur_date, time=[23, 59, 59])
+            if closures.count(day_start, day_end, strict=True):
+                continue
+            calendar[offset] = day_num_method(tf, cur_date, seen_cycle_days)
+
+        return bytes(calendar)
 
     @staticmethod
-    def __day_num_calendar_days(tf, target_date):
+    def __day_num_calendar_days(tf, target_date, seen_cycle_days):
         """
         Gets the day number from if the calendar day is even (day 2) or odd (day 1).
         """
-        if tf["cycle"]["length"] != 2:
+        if tf.cycle_length != 2:
             raise TypeError(
                 "calendar_days cannot be used in formats where cycle length != 2"
             )
         even, odd = 0, 1
         return {even: 2, odd: 1}[target_date.day % 2]
 
-    def __day_num_consecutive(self, tf, target_date):
+    @staticmethod
+    def __day_num_consecutive(tf, target_date, seen_cycle_days):
         """
         Gets the day number by counting consecutive days.
+        Instructional days must be passed in chronological order, sharing seen_cycle_days.
         """
-        cycle_duration = tf["cycle"]["duration"]
-
-        cur_iter_day = self.start_datetime().replace(hour=11, minute=0, second=0)
-        cycle_day_type_set = set()
+        cycle_duration = tf.cycle_duration
 
-        while cur_iter_day <= target_date:
-            if self.day_is_instructional(cur_iter_day):
-                if cycle_duration == "day":
-                    cycle_day_type_set.add(cur_iter_day.timetuple().tm_yday)
-                elif cycle_duration == "week":
-                    cycle_day_type_set.add(cur_iter_day.isocalendar()[1])
-                else:
-                    raise NotImplementedError
-            cur_iter_day += dt.timedelta(1)
+        if cycle_duration == "day":
+            seen_cycle_days.add(target_date.timetuple().tm_yday)
+        elif cycle_duration == "week":
+            seen_cycle_days.add(target_date.isocalendar()[1])
+        else:
+            raise NotImplementedError
 
-        return (len(cycle_day_type_set) - 1) % tf["cycle"]["length"] + 1
+        return (len(seen_cycle_days) - 1) % tf.cycle_length + 1
 
     def day_schedule_format(self, target_date=None):
-        target_date_start = utils.get_localdate(date=target_date, time=[0, 0, 0])
-        target_date_end = utils.get_localdate(date=target_date, time=[23, 59, 59])
+        target_date = utils.to_date(target_date)
+        schedule_format, _schedule = self.__cached_days([target_date])[target_date]
+        return schedule_format
 
-        schedule_formats = settings.TIMETABLE_FORMATS[self.timetable_format][
-            "schedules"
-        ]
-        schedule_format_set = set(
-            self.events.filter(
-                start_date__lte=target_date_end, end_date__gte=target_date_start
-            ).values_list("schedule_format", flat=True)
-        ).intersection(set(schedule_formats.keys()))
-        for schedule_format in list(schedule_formats.keys())[::-1]:
-            if schedule_format in schedule_format_set:
-                return schedule_format
+    def day_schedule(self, target_date=None):
+        target_date = utils.to_date(target_date)
+        _schedule_format, schedule = self.__cached_days([target_date])[target_date]
+        return schedule
 
-        return "default"
+    def day_schedule_range(self, start_date, end_date):
+        """
+        Returns the schedule of every day from start_date to end_date (inclusive), keyed by date.
+        The events overlapping each day are looked up in the term's interval index.
+        """
+        return {
+            target_date: schedule
+            for target_date, (_schedule_format, schedule) in self.__cached_days(
+                utils.date_range(utils.to_date(start_date), utils.to_date(end_date))
+            ).items()
+        }
 
-    def day_schedule(self, target_date=None):
-        target_date = utils.get_localdate(date=target_date)
+    def __cached_days(self, dates):
+        """
+        Returns the (schedule format, schedule) of every date in dates (which must be sorted).
+        Days are cached per term cache version, so they are invalidated along with the calendar.
+        """
+        version = self.cache_version()
+        keys = {
+            target_date: TERM_DAY_CACHE_KEY.format(
+                self.pk, version, target_date.isoformat()
+            )
+            for target_date in dates
+        }
+        cached = cache.get_many(keys.values())
+
+        result = {}
+        missing = []
+        for target_date in dates:
+            if keys[target_date] in cached:
+                result[target_date] = cached[keys[target_date]]
+            else:
+                missing.append(target_date)
+
+        if missing:
+            computed = self.__compute_days(missing[0], missing[-1])
+            missing_days = {
+                target_date: computed[target_date] for target_date in missing
+            }
+            cache.set_many(
+                {keys[target_date]: day for target_date, day in missing_days.items()},
+                TERM_CACHE_TIMEOUT,
+            )
+            result.update(missing_days)
 
-        timetable_config = settings.TIMETABLE_FORMATS[self.timetable_format]
-        day_num = self.day_num(target_date=target_date)
+        return result
 
-        if day_num is None:
-            return []
+    def __compute_days(self, start_date, end_date):
+        dates = utils.date_range(start_date, end_date)
+        calendar = self.instructional_calendar()
+        tf = self.compiled_format
 
-        result = []
+        events, _closures = self.event_index()
 
-        for i in timetable_config["schedules"][
-            self.day_schedule_format(target_date=target_date)
-        ]:
-            start_time = timezone.make_aware(
-                dt.datetime.combine(target_date, dt.time(*i["time"][0]))
+        result = {}
+        for target_date in dates:
+            target_date_start = utils.get_localdate(date=target_date, time=[0, 0, 0])
+            target_date_end = utils.get_localdate(date=target_date, time=[23, 59, 59])
+            schedule_format = tf.resolve_schedule_format(
+                events.overlapping(target_date_start, target_date_end)
             )
-            end_time = timezone.make_aware(
-                dt.datetime.combine(target_date, dt.time(*i["time"][1]))
+            day_num = (
+                calendar[self.__day_offset(target_date)] or None
+                if self.is_current(target_date)
+                else None
             )
-
-            result.append(
-                {
-                    "description": i["description"],
-                    "time": {
-                        "start": start_time,
-                        "end": end_time,
-                    },
-                    "position": i["position"][day_num - 1],
-                    "cycle": f'{timetable_config["cycle"]["duration"].title()} {day_num}',
-                    "course": f'{timetable_config["cycle"]["duration"].title()} {day_num} {i["description"]["course"]}',
-                }
+            result[target_date] = (
+                schedule_format,
+                (
+                    self.__build_day_schedule(target_date, day_num, schedule_format)
+                    if day_num is not None
+                    else []
+                ),
             )
 
         return result
 
+    def __build_day_schedule(self, target_date, day_num, schedule_format):
+        tf = self.compiled_format
+        cycle = tf.cycle_labels[day_num - 1]
+
+        return [
+            {
+                "description": dict(period.description),
+                "time": {
+                    "start": timezone.make_aware(
+                        dt.datetime.combine(target_date, period.start)
+                    ),
+                    "end": timezone.make_aware(
+                        dt.datetime.combine(target_date, period.end)
+                    ),
+                },
+                "position": period.positions[day_num - 1],
+                "cycle": cycle,
+                "course": period.course_labels[day_num - 1],
+            }
+            for period in tf.schedules[schedule_format]
+        ]
+
     class MisconfiguredTermError(Exception):
         pass
 
@@ -184,16 +346,85 @@ class Term(models.Model):
 
     @classmethod
     def get_current(cls, target_date=None):
-        target_date = utils.get_localdate(date=target_date)
+        """
+        Returns the term running on target_date (default today), or None.
+        Lookups are memoized for the current request (see memoize_current) and, within this process, for the current local date until a term is saved or deleted.
+        """
+        target_date = _to_query_date(target_date)
+
+        request_memo = _request_current_terms.get()
+        if request_memo is not None and target_date in request_memo:
+            return request_memo[target_date]
+
+        process_memo = _CurrentTermMemo.get()
+        if target_date in process_memo.terms:
+            term = copy.copy(process_memo.terms[target_date])
+        else:
+            try:
+                term = cls.objects.get(
+                    start_date__lte=target_date, end_date__gt=target_date
+                )
+            except cls.DoesNotExist:
+                term = None
+            except MultipleObjectsReturned:
+                raise cls.MisconfiguredTermError
+            process_memo.add(target_date, copy.copy(term))
+
+        if request_memo is not None:
+            request_memo[target_date] = term
+        return term
 
+    @staticmethod
+    @contextlib.contextmanager
+    def memoize_current():
+        """
+        Memoizes get_current until the block exits, so repeated calls (e.g. one per day of a week) share a single lookup.
+        """
+        token = _request_current_terms.set({})
         try:
-            return cls.objects.get(
-                start_date__lte=target_date, end_date__gt=target_date
-            )
-        except cls.DoesNotExist:
-            return None
-        except MultipleObjectsReturned:
-            raise cls.MisconfiguredTermError
+            yield
+        finally:
+            _request_current_terms.reset(token)
+
+    @staticmethod
+    def invalidate_current():
+        cache.set(CURRENT_TERM_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+_request_current_terms: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "request_current_terms", default=None
+)
+
+
+class _CurrentTermMemo:
+    """
+    Process-wide memo of Term.get_current.
+    It is only valid for one local date and one current term version, which is replaced whenever a term is saved or deleted.
+    """
+
+    MAX_SIZE = 366
+    _instance = None
+
+    def __init__(self, today, version):
+        self.today = today
+        self.version = version
+        self.terms = {}
+
+    @classmethod
+    def get(cls) -> _CurrentTermMemo:
+        today = timezone.localdate()
+        version = cache.get_or_set(
+            CURRENT_TERM_VERSION_KEY, lambda: uuid.uuid4().hex, None
+        )
+        memo = cls._instance
+        if memo is None or memo.today != today or memo.version != version:
+            memo = cls._instance = cls(today, version)
+        return memo
+
+    def add(self, target_date, term):
+        if len(self.terms) >= self.MAX_SIZE:
+            self.terms.clear()
+        self.terms[target_date] = term
 
 
 class Course(models.Model):
@@ -288,10 +519,34 @@ class Event(models.Model):
 
         self.clean()
 
-        schedule_formats = settings.TIMETABLE_FORMATS[self.term.timetable_format][
-            "schedules"
-        ]
-        self.is_instructional = len(schedule_formats[self.schedule_format]) > 0
-        # PA days and holidays do not have time data
+        self.is_instructional = self.term.compiled_format.is_instructional(
+            self.schedule_format
+        )
 
         super().save(*args, **kwargs)
+
+
+@receiver([post_save, post_delete], sender=Term)
+def invalidate_term_cache(sender, instance, **kwargs):
+    Term.invalidate_cache(instance.pk)
+    Term.invalidate_current()
+
+
+@receiver(pre_save, sender=Event)
+def remember_event_term(sender, instance, **kwargs):
+    # an event moved to another term changes the schedules of both
+    instance._previous_term_id = (
+        None
+        if instance.pk is None
+        else sender.objects.filter(pk=instance.pk)
+        .values_list("term_id", flat=True)
+        .first()
+    )
+
+
+@receiver([post_save, post_delete], sender=Event)
+def invalidate_event_term_cache(sender, instance, **kwargs):
+    Term.invalidate_cache(instance.term_id)
+    previous_term_id = getattr(instance, "_previous_term_id", None)
+    if previous_term_id is not None and previous_term_id != instance.term_id:
+        Term.invalidate_cache(previous_term_id)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hashlib
 from typing import TYPE_CHECKING, Optional
 
 from django.conf import settings
@@ -202,10 +203,22 @@ class DailyAnnouncement(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     creation_date = models.DateTimeField(auto_now_add=True)
+    # identifies the Google Sheets row this was imported from, see fetch_announcements
+    source_hash = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False
+    )
 
     def __str__(self) -> str:
         return self.content[:75]
 
+    @staticmethod
+    def hash_source(organization, start_date, end_date, content) -> str:
+        return hashlib.sha256(
+            "\x1f".join(
+                (organization, start_date.isoformat(), end_date.isoformat(), content)
+            ).encode()
+        ).hexdigest()
+
     @classmethod
     def get_todays_announcements(cls) -> QuerySet:
         return cls.objects.filter(
@@ -1,11 +1,21 @@
+import uuid
+
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
 
 from .. import utils
 from .course import Course, Term
 
 # Create your models here.
 
+TIMETABLE_COURSES_VERSION_KEY = "timetable_courses_version:{}"
+# timetable id, courses version, timetable format, schedule format
+TIMETABLE_GRID_CACHE_KEY = "timetable_grid:{}:{}:{}:{}"
+TIMETABLE_GRID_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 def get_default_timetable_format():
     return settings.DEFAULT_TIMETABLE_FORMAT
@@ -28,38 +38,79 @@ class Timetable(models.Model):
     def day_schedule(self, target_date=None):
         target_date = utils.get_localdate(date=target_date)
 
-        courses = {}
-        for i in self.courses.all():
-            courses[i.position] = i
-
-        result = self.term.day_schedule(target_date=target_date)
+        return self.__resolve_courses(
+            self.term.day_schedule(target_date=target_date),
+            self.course_resolver(),
+        )
 
-        for i in range(0, len(result)):
-            course_positions = result[i]["position"]
+    def day_schedule_range(self, start_date, end_date):
+        """
+        Returns the schedule of every day from start_date to end_date (inclusive), keyed by date.
+        """
+        resolver = self.course_resolver()
+
+        return {
+            target_date: self.__resolve_courses(result, resolver)
+            for target_date, result in self.term.day_schedule_range(
+                start_date, end_date
+            ).items()
+        }
+
+    def course_resolver(self):
+        return utils.CourseResolver(self.courses.all())
+
+    def courses_version(self) -> str:
+        return cache.get_or_set(
+            TIMETABLE_COURSES_VERSION_KEY.format(self.pk),
+            lambda: uuid.uuid4().hex,
+            None,
+        )
 
-            try:
-                course_code = courses[
-                    course_positions.intersection(set(courses.keys())).pop()
-                ].code
-            except KeyError:
-                course_code = None
+    @classmethod
+    def invalidate_courses(cls, timetable_ids):
+        """
+        Invalidates everything cached from the course sets of these timetables (such as the rendered grid)
+        by moving them to a new courses version.
+        """
+        cache.set_many(
+            {
+                TIMETABLE_COURSES_VERSION_KEY.format(timetable_id): uuid.uuid4().hex
+                for timetable_id in timetable_ids
+            },
+            None,
+        )
 
-            result[i]["course"] = course_code
+    def grid_cache_key(self, schedule_format) -> str:
+        return TIMETABLE_GRID_CACHE_KEY.format(
+            self.pk,
+            self.courses_version(),
+            self.term.timetable_format,
+            schedule_format,
+        )
 
+    def __resolve_courses(self, result, resolver):
+        """
+        Fills in the course of each period and merges back-to-back periods of the same course.
+        The periods in result are copied, not modified.
+        """
+        masks = self.term.compiled_format.masks
         merged_result = []
 
-        cur_period_idx = 0
-        while cur_period_idx < len(result):
-            merged_result.append(result[cur_period_idx])
-            cur_course = result[cur_period_idx]["course"]
-            while (
-                cur_period_idx + 1 < len(result)
-                and cur_course is not None
-                and cur_course == result[cur_period_idx + 1]["course"]
+        for period in result:
+            course = resolver.resolve(masks[period["position"]])
+            course_code = course.code if course is not None else None
+
+            if (
+                course_code is not None
+                and merged_result
+                and merged_result[-1]["course"] == course_code
             ):
-                cur_period_idx += 1
-                merged_result[-1]["time"]["end"] = result[cur_period_idx]["time"]["end"]
-            cur_period_idx += 1
+                merged_result[-1]["time"] = {
+                    **merged_result[-1]["time"],
+                    "end": period["time"]["end"],
+                }
+            else:
+                merged_result.append({**period, "course": course_code})
 
         return merged_result
 
@@ -70,3 +121,21 @@ class Timetable(models.Model):
                 name="unique_timetable_owner_and_term",
             )
         ]
+
+
+@receiver(m2m_changed, sender=Timetable.courses.through)
+def invalidate_timetable_courses(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            Timetable.invalidate_courses([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        Timetable.invalidate_courses(pk_set)
+    elif action == "pre_clear":
+        Timetable.invalidate_courses(instance.timetables.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Course)
+@receiver(pre_delete, sender=Course)
+def invalidate_course_timetables(sender, instance, **kwargs):
+    # the course code or position may have changed
+    Timetable.invalidate_courses(instance.timetables.values_list("pk", flat=True))
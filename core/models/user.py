@@ -1,8 +1,8 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
-from django.db.models import CharField, Q
+from django.db import models, transaction
+from django.db.models import CharField, Exists, OuterRef, Q
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
@@ -10,6 +10,7 @@ from django.utils import timezone
 from core.models import course, graduating_year_choices, post
 from core.utils.choices import calculate_years
 from core.utils.fields import ChoiceArrayField, SetField
+from core.utils.local_date import date_range, to_date
 from core.utils.mail import send_mail
 
 # Create your models here.
@@ -47,12 +48,6 @@ class User(AbstractUser):
     saved_blogs = models.ManyToManyField("BlogPost", blank=True)
     saved_announcements = models.ManyToManyField("Announcement", blank=True)
 
-    expo_notif_tokens = models.JSONField(
-        "Expo Notifications Tokens",
-        default=dict,
-        help_text="JSON object with keys as tokens and values as null.",
-        # the length is not specified :( https://github.com/expo/expo/issues/1135#issuecomment-399622890
-    )
     is_deleted = models.BooleanField(
         default=False,
         help_text="If the user is deleted. Never change this in admin",
@@ -86,15 +81,34 @@ class User(AbstractUser):
             return None
 
     def schedule(self, target_date=None):
-        if target_date is None:
-            target_date = timezone.localdate()
+        target_date = to_date(target_date)
+
+        return self.schedule_range(target_date, target_date)[target_date]
 
-        result = []
+    def schedule_range(self, start_date, end_date):
+        """
+        Returns the merged schedule of every day from start_date to end_date (inclusive), keyed by date.
+        The timetables running in the range are fetched with their terms and courses up front,
+        and each term's days come from its cached day schedules (one events query per term on a miss).
+        """
+        start_date, end_date = to_date(start_date), to_date(end_date)
+        result = {target_date: [] for target_date in date_range(start_date, end_date)}
 
-        for timetable in self.timetables.all():
-            result.extend(timetable.day_schedule(target_date=target_date))
+        timetables = (
+            self.timetables.filter(
+                term__start_date__lte=end_date, term__end_date__gt=start_date
+            )
+            .select_related("term")
+            .prefetch_related("courses")
+        )
+        for timetable in timetables:
+            for target_date, schedule in timetable.day_schedule_range(
+                start_date, end_date
+            ).items():
+                result[target_date].extend(schedule)
 
-        result.sort(key=lambda x: (x["time"]["start"], x["time"]["end"]))
+        for schedule in result.values():
+            schedule.sort(key=lambda x: (x["time"]["start"], x["time"]["end"]))
 
         return result
 
@@ -165,6 +179,152 @@ class User(AbstractUser):
         return cls.objects.filter(is_active=True)
 
 
+class PushToken(models.Model):
+    """
+    An Expo push token of a user, along with the notification categories it accepts.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="push_tokens",
+    )
+    # the length is not specified :( https://github.com/expo/expo/issues/1135#issuecomment-399622890
+    token = models.CharField(
+        max_length=255,
+        help_text="Expo push token, without the ExponentPushToken[...] wrapper.",
+    )
+    options = models.JSONField(
+        null=True, blank=True, help_text="Options as submitted by the app."
+    )
+    allow_all = models.BooleanField(
+        default=True,
+        help_text="Whether every category is allowed. Otherwise, only the allowed categories are.",
+    )
+    last_success = models.DateTimeField(null=True, blank=True)
+    failure_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} ({self.token})"
+
+    @classmethod
+    def eligible(cls, category: str):
+        """
+        Returns the tokens that accept notifications of category.
+        """
+        return cls.objects.filter(
+            Q(allow_all=True)
+            | Exists(
+                PushTokenCategory.objects.filter(
+                    push_token=OuterRef("pk"), category=category
+                )
+            )
+        )
+
+    @classmethod
+    def register(cls, user, token: str, options) -> "PushToken":
+        """
+        Creates or updates a token of user. options may limit the categories with an "allow" object keyed by category.
+        """
+        allowlist = options.get("allow") if isinstance(options, dict) else None
+        allow_all = not isinstance(allowlist, dict)
+        with transaction.atomic():
+            push_token, _ = cls.objects.update_or_create(
+                user=user,
+                token=token,
+                defaults=dict(options=options, allow_all=allow_all),
+            )
+            push_token.allowed_categories.all().delete()
+            if not allow_all:
+                PushTokenCategory.objects.bulk_create(
+                    PushTokenCategory(push_token=push_token, category=category)
+                    for category in allowlist
+                )
+        return push_token
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "token"], name="unique_push_token_user_and_token"
+            ),
+        ]
+        indexes = [models.Index(fields=["token"])]
+
+
+class PushTokenCategory(models.Model):
+    push_token = models.ForeignKey(
+        PushToken, on_delete=models.CASCADE, related_name="allowed_categories"
+    )
+    category = models.CharField(max_length=64)
+
+    def __str__(self):
+        return self.category
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["push_token", "category"],
+                name="unique_push_token_category",
+            ),
+        ]
+        indexes = [models.Index(fields=["category", "push_token"])]
+        verbose_name_plural = "push token categories"
+
+
+class PendingPushReceipt(models.Model):
+    """
+    A message accepted by Expo whose push receipt has not been checked yet.
+    """
+
+    push_token = models.ForeignKey(
+        PushToken, on_delete=models.CASCADE, related_name="pending_receipts"
+    )
+    ticket_id = models.CharField(max_length=64, unique=True)
+    sent_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.ticket_id
+
+
+class PushDeliveryStats(models.Model):
+    date = models.DateField(unique=True)
+    sent = models.PositiveIntegerField(
+        default=0, help_text="Messages accepted by Expo."
+    )
+    delivered = models.PositiveIntegerField(
+        default=0, help_text="Messages with a successful push receipt."
+    )
+    failed = models.PositiveIntegerField(
+        default=0,
+        help_text="Messages that failed for any reason other than an unregistered device.",
+    )
+    unregistered = models.PositiveIntegerField(
+        default=0, help_text="Messages to tokens that are no longer registered."
+    )
+    expired = models.PositiveIntegerField(
+        default=0, help_text="Messages whose push receipt never became available."
+    )
+
+    def __str__(self):
+        return str(self.date)
+
+    @classmethod
+    def record(cls, **counts):
+        """
+        Adds counts to today's statistics.
+        """
+        counts = {field: count for field, count in counts.items() if count}
+        if not counts:
+            return
+        stats, _ = cls.objects.get_or_create(date=timezone.localdate())
+        cls.objects.filter(pk=stats.pk).update(
+            **{field: models.F(field) + count for field, count in counts.items()}
+        )
+
+    class Meta:
+        verbose_name_plural = "push delivery stats"
+
+
 class StaffMember(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -1,5 +1,7 @@
 import datetime as dt
 import functools
+import itertools
+import time
 from pathlib import Path
 
 import pytz
@@ -7,8 +9,8 @@ import requests
 from celery.schedules import crontab
 from celery.utils.log import get_task_logger
 from django.conf import settings
-from django.db.models import F, JSONField, Q, Value
-from django.db.models.functions.text import Concat
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _l
 from django.utils.translation import ngettext
@@ -16,17 +18,30 @@ from exponent_server_sdk import (
     DeviceNotRegisteredError,
     PushClient,
     PushMessage,
+    PushServerError,
+    PushTicket,
     PushTicketError,
 )
 from oauth2_provider.models import clear_expired
-from requests.exceptions import ConnectionError, HTTPError
+from requests.exceptions import ConnectionError, HTTPError, Timeout
 
 import gspread
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 
-from core.models import Announcement, BlogPost, Comment, Event, User, DailyAnnouncement
-from core.utils.tasks import get_random_username
+from core.models import (
+    Announcement,
+    BlogPost,
+    Comment,
+    DailyAnnouncement,
+    Event,
+    PendingPushReceipt,
+    PushDeliveryStats,
+    PushToken,
+    User,
+)
+from core.utils import notif_coalesce
+from core.utils.tasks import get_random_usernames
 from metropolis.celery import app
 
 logger = get_task_logger(__name__)
@@ -49,14 +64,126 @@ for m in ("get", "options", "head", "post", "put", "patch", "delete"):
     )
 
 
-def users_with_token():
-    return User.objects.exclude(Q(expo_notif_tokens=Value({}, JSONField())))
+def users_with_token(category=None):
+    """
+    Returns the users with a push token, or with a push token that accepts category.
+    """
+    tokens = (
+        PushToken.objects.all() if category is None else PushToken.eligible(category)
+    )
+    return User.objects.filter(Exists(tokens.filter(user=OuterRef("pk"))))
+
+
+def expo_client():
+    return PushClient(
+        host=settings.NOTIF_EXPO_HOST,
+        session=session,
+        max_message_count=settings.NOTIF_EXPO_BATCH_SIZE,
+        # PushClient passes its own timeout to the session, overriding the default above
+        timeout=settings.NOTIF_EXPO_TIMEOUT_SECS,
+    )
+
+
+def push_messages(tokens, msg_kwargs):
+    """
+    Yields a (PushToken, PushMessage) pair for every token.
+    """
+    for push_token in tokens:
+        yield (
+            push_token,
+            PushMessage(to=f"ExponentPushToken[{push_token.token}]", **msg_kwargs),
+        )
+
+
+def publish_batched(messages):
+    """
+    Sends (PushToken, PushMessage) pairs to Expo, one request per NOTIF_EXPO_BATCH_SIZE messages.
+    The outcome is recorded on each token, tokens that are no longer registered are deleted
+    and the tickets of accepted messages are stored for reconcile_push_receipts.
+
+    :returns: The ids of the tokens that should be retried and the last error
+    """
+    client = expo_client()
+    error = None
+    succeeded, failed, notreg = [], [], []
+    messages = iter(messages)
+    while batch := list(itertools.islice(messages, settings.NOTIF_EXPO_BATCH_SIZE)):
+        try:
+            tickets = client.publish_multiple([message for _, message in batch])
+        except (ConnectionError, HTTPError, Timeout, PushServerError) as exc:
+            failed.extend(push_token.id for push_token, _ in batch)
+            error = exc
+            continue
+        # tickets are returned in the order of the messages
+        for (push_token, _), ticket in zip(batch, tickets):
+            try:
+                ticket.validate_response()
+            except DeviceNotRegisteredError:
+                notreg.append(push_token.id)
+            except PushTicketError as exc:
+                failed.append(push_token.id)
+                error = exc
+            else:
+                succeeded.append((push_token.id, ticket.id))
+    record_delivery(succeeded, failed, notreg)
+    return set(failed), error
+
+
+def record_delivery(succeeded, failed, notreg):
+    """
+    succeeded holds (token id, ticket id) pairs, failed and notreg hold token ids.
+    """
+    if succeeded:
+        PushToken.objects.filter(id__in=[t for t, _ in succeeded]).update(
+            last_success=timezone.now(), failure_count=0
+        )
+        PendingPushReceipt.objects.bulk_create(
+            (
+                PendingPushReceipt(push_token_id=push_token_id, ticket_id=ticket_id)
+                for push_token_id, ticket_id in succeeded
+                if ticket_id
+            ),
+            ignore_conflicts=True,
+        )
+    if failed:
+        PushToken.objects.filter(id__in=failed).update(
+            failure_count=F("failure_count") + 1
+        )
+    if notreg:
+        PushToken.objects.filter(id__in=notreg).delete()
+    PushDeliveryStats.record(
+        sent=len(succeeded), failed=len(failed), unregistered=len(notreg)
+    )
+
+
+def fan_out(source, recipients, msg_kwargs):
+    """
+    Streams the ids of recipients and enqueues one notif_batch per NOTIF_FANOUT_CHUNK_SIZE of them.
+    Tokens are selected by notif_batch, so only ids are loaded here.
+    """
+    start = time.monotonic()
+    ids = (
+        recipients.values_list("id", flat=True)
+        .distinct()
+        .order_by("id")
+        .iterator(chunk_size=settings.NOTIF_FANOUT_CHUNK_SIZE)
+    )
+    queued = chunks = 0
+    while chunk := list(itertools.islice(ids, settings.NOTIF_FANOUT_CHUNK_SIZE)):
+        notif_batch.delay(chunk, msg_kwargs)
+        queued += len(chunk)
+        chunks += 1
+        logger.info(f"{source}: queued chunk {chunks} ({queued} users so far)")
+    logger.info(
+        f"{source}: fanned out to {queued} users in {chunks} chunks in {time.monotonic() - start:.2f}s"
+    )
 
 
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
     sender.add_periodic_task(crontab(hour=0, minute=0), delete_expired_users)
     sender.add_periodic_task(crontab(hour=18, minute=0), notif_events_singleday)
+    sender.add_periodic_task(crontab(minute="*/15"), reconcile_push_receipts)
     sender.add_periodic_task(crontab(day_of_month=1), run_group_migrations)
     sender.add_periodic_task(
         crontab(hour=1, minute=0), clear_expired
@@ -73,27 +200,50 @@ def delete_expired_users():
     queryset = User.objects.filter(
         is_deleted=True,
         last_login__lt=dt.datetime.now() - dt.timedelta(days=14),
+    ).exclude(username__startswith="deleted-")  # already scrubbed
+    user_ids = list(queryset.order_by("pk").values_list("pk", flat=True))
+    start = time.monotonic()
+    done = 0
+    # short transactions, so a large cleanup never holds locks on the user table for long
+    for chunk in itertools.batched(user_ids, settings.DELETE_EXPIRED_USERS_CHUNK_SIZE):
+        with transaction.atomic():
+            scrub_users(chunk)
+        done += len(chunk)
+        logger.info(f"delete_expired_users: scrubbed {done}/{len(user_ids)} users")
+    logger.info(
+        f"delete_expired_users: scrubbed {done} users in {time.monotonic() - start:.2f}s"
     )
-    comments = Comment.objects.filter(author__in=queryset)
-    comments.update(
+
+
+def scrub_users(user_ids):
+    PushToken.objects.filter(user_id__in=user_ids).delete()
+    Comment.objects.filter(author_id__in=user_ids).update(
         body=None, last_modified=timezone.now()
     )  # if body is None "deleted on %last_modified% would be shown
-    queryset.update(  # We need to object to not break posts or comments
+    for field in (
+        "organizations",
+        "tags_following",
+        "saved_blogs",
+        "saved_announcements",
+    ):
+        getattr(User, field).through.objects.filter(user_id__in=user_ids).delete()
+    User.objects.filter(
+        pk__in=user_ids
+    ).update(  # We need to object to not break posts or comments
         first_name="Deleted",
         last_name="User",
-        username=get_random_username(),
         bio="",
-        timezone="",
         graduating_year=None,
         is_teacher=False,
-        organizations=[],
-        tags_following=[],
         qltrs=None,
-        saved_blogs=[],
-        saved_announcements=[],
-        expo_notif_tokens={},
     )
-    queryset.update(email=Concat(F("random_username"), Value("@maclyonsden.com")))
+    User.objects.bulk_update(
+        [
+            User(pk=user_id, username=username, email=f"{username}@maclyonsden.com")
+            for user_id, username in zip(user_ids, get_random_usernames(len(user_ids)))
+        ],
+        ["username", "email"],
+    )
 
 
 @app.task
@@ -115,24 +265,24 @@ def notif_broker_announcement(obj_id):
             f"notif_broker_announcement: announcement {obj_id} does not exist"
         )
         return
-    affected = users_with_token()
     if ann.organization.id in settings.ANNOUNCEMENTS_NOTIFY_FEEDS:
         category = "ann.public"
+        affected = users_with_token(category)
     else:
-        affected = affected.filter(
+        category = "ann.personal"
+        affected = users_with_token(category).filter(
             Q(tags_following__in=ann.tags.all())
             | Q(organizations__in=[ann.organization])
         )
-        category = "ann.personal"
-    for u in affected.all():
-        notif_single.delay(
-            u.id,
-            dict(
-                title=_l("New Announcement: %(title)s") % dict(title=ann.title),
-                body=ann.body,
-                category=category,
-            ),
-        )
+    fan_out(
+        f"notif_broker_announcement {obj_id}",
+        affected,
+        dict(
+            title=_l("New Announcement: %(title)s") % dict(title=ann.title),
+            body=ann.body,
+            category=category,
+        ),
+    )
 
 
 @app.task
@@ -144,16 +294,16 @@ def notif_broker_blogpost(obj_id):
         logger.warning(f"notif_broker_blogpost: blogpost {obj_id} does not exist")
         return
     if settings.NOTIFICATIONS_ENABLED:
-        affected = users_with_token()
-        for u in affected.all():
-            notif_single.delay(
-                u.id,
-                dict(
-                    title=_l("New Blog Post: %(title)s") % dict(title=post.title),
-                    body=post.body,
-                    category="blog",
-                ),
-            )
+        affected = users_with_token("blog")
+        fan_out(
+            f"notif_broker_blogpost {obj_id}",
+            affected,
+            dict(
+                title=_l("New Blog Post: %(title)s") % dict(title=post.title),
+                body=post.body,
+                category="blog",
+            ),
+        )
 
 
 @app.task
@@ -166,83 +316,227 @@ def notif_events_singleday(date: dt.date = None):
     elif isinstance(date, str):  # ken things
         date = dt.datetime.fromisoformat(date)
         raise RuntimeError(f"date {type(date)} {date}")
-    eligible = users_with_token()
-    for u in eligible.all():
-        # assume we don't have 10 million events overlapping a single day (we can't fit it in a single notif aniway)
-        date_mintime = tz.localize(dt.datetime.combine(date, dt.datetime.min.time()))
-        date_maxtime = tz.localize(dt.datetime.combine(date, dt.datetime.max.time()))
-        covering = list(
-            Event.get_events(u)
-            .filter(
-                start_date__lte=date_maxtime,
-                end_date__gte=date_mintime,
-            )
-            .all()
-        )
-        if len(covering) == 0:
-            continue
-        covering.sort(key=lambda e: int(e.schedule_format == "default"))
-        covering.sort(key=lambda e: e.start_date - date_mintime)
-        body = ngettext(
-            "%(count)d Event:\n",
-            "%(count)d Events:\n",
-            len(covering),
-        ) % dict(count=len(covering))
-        for i, e in enumerate(covering):
-            body += _l("%(i)d. %(title)s\n") % dict(i=i + 1, title=e.name)
-        headline = covering[0]
-        notif_single.delay(
-            u.id,
-            dict(
-                title=_l("%(date)s: %(headline)s")
-                % dict(date=date.strftime("%a %b %d"), headline=headline.name),
-                body=body,
-                category="event.singleday",
-            ),
+    # assume we don't have 10 million events overlapping a single day (we can't fit it in a single notif aniway)
+    date_mintime = tz.localize(dt.datetime.combine(date, dt.datetime.min.time()))
+    date_maxtime = tz.localize(dt.datetime.combine(date, dt.datetime.max.time()))
+    # Event.get_events(u) only ever returns public events (its member clause filters the public queryset),
+    # so every user's covering list is the same and is computed once
+    covering = list(
+        Event.get_events()
+        .filter(
+            start_date__lte=date_maxtime,
+            end_date__gte=date_mintime,
         )
+        .order_by("pk")
+    )
+    if len(covering) == 0:
+        return
+    covering.sort(key=lambda e: int(e.schedule_format == "default"))
+    covering.sort(key=lambda e: e.start_date - date_mintime)
+    body = ngettext(
+        "%(count)d Event:\n",
+        "%(count)d Events:\n",
+        len(covering),
+    ) % dict(count=len(covering))
+    for i, e in enumerate(covering):
+        body += _l("%(i)d. %(title)s\n") % dict(i=i + 1, title=e.name)
+    headline = covering[0]
+    fan_out(
+        f"notif_events_singleday {date}",
+        users_with_token("event.singleday"),
+        dict(
+            title=_l("%(date)s: %(headline)s")
+            % dict(date=date.strftime("%a %b %d"), headline=headline.name),
+            body=body,
+            category="event.singleday",
+        ),
+    )
 
 
 @app.task(bind=True)
-def notif_single(self, recipient_id: int, msg_kwargs):
+def notif_single(self, recipient_id: int, msg_kwargs, token_ids=None):
+    """
+    Sends a notification to every token of one user, or only to token_ids when retrying.
+    """
     if not settings.NOTIFICATIONS_ENABLED:
         return
     recipient = User.objects.get(id=recipient_id)
+    tokens = PushToken.eligible(msg_kwargs["category"]).filter(user=recipient)
+    if token_ids is not None:
+        tokens = tokens.filter(id__in=token_ids)
+    tokens = list(tokens.order_by("id"))
     logger.info(
-        f"notif_single to {recipient} ({recipient.expo_notif_tokens}): {msg_kwargs}"
+        f"notif_single to {recipient} ({[t.token for t in tokens]}): {msg_kwargs}"
         + ("(dry run)" if settings.NOTIF_DRY_RUN else "")
     )
     if settings.NOTIF_DRY_RUN:
         return
-    notreg_tokens = set()
-    for token, options in recipient.expo_notif_tokens.items():
-        if options is not None:
-            allowlist = options.get("allow")
-            if (
-                isinstance(allowlist, dict)
-                and msg_kwargs["category"] not in allowlist.keys()
-            ):
-                logger.info(
-                    f"notif_single (category {msg_kwargs['category']}) not allowed to {recipient} (allowlist {allowlist}) ({recipient.expo_notif_tokens}): {msg_kwargs}"
-                    + ("(dry run)" if settings.NOTIF_DRY_RUN else "")
-                )
-                continue
-        try:
-            resp = PushClient(session=session).publish(
-                PushMessage(to=f"ExponentPushToken[{token}]", **msg_kwargs)
+    retry_ids, error = publish_batched(push_messages(tokens, msg_kwargs))
+    if retry_ids:
+        raise self.retry(
+            args=(recipient_id, msg_kwargs),
+            kwargs=dict(token_ids=sorted(retry_ids)),
+            exc=error,
+        )
+
+
+@app.task(bind=True)
+def notif_batch(
+    self, recipient_ids: list[int], msg_kwargs, coalesce=True, token_ids=None
+):
+    """
+    Sends the same notification to many users, batching the messages of all their tokens into as few Expo requests as possible.
+    Recipients that were notified recently or are over their rate limit are held by notif_coalesce and summarized later,
+    unless coalesce is False.
+    Only the tokens whose messages failed are retried, through token_ids.
+    """
+    if not settings.NOTIFICATIONS_ENABLED:
+        return
+    if coalesce:
+        recipient_ids, held = notif_coalesce.coalesce(recipient_ids, msg_kwargs)
+        for flush_at, user_ids in held.items():
+            notif_flush.apply_async(
+                (user_ids, msg_kwargs["category"], flush_at),
+                eta=dt.datetime.fromtimestamp(flush_at, tz=dt.timezone.utc),
             )
-        except (ConnectionError, HTTPError) as exc:
-            raise self.retry(exc=exc)
+        if held:
+            logger.info(
+                f"notif_batch: held for {sum(map(len, held.values()))} users: {msg_kwargs}"
+            )
+        if not recipient_ids:
+            return
+    logger.info(
+        f"notif_batch to {len(recipient_ids)} users: {msg_kwargs}"
+        + ("(dry run)" if settings.NOTIF_DRY_RUN else "")
+    )
+    if settings.NOTIF_DRY_RUN:
+        return
+    start = time.monotonic()
+    retry_ids, error = deliver_batch(recipient_ids, msg_kwargs, token_ids)
+    logger.info(
+        f"notif_batch to {len(recipient_ids)} users finished in {time.monotonic() - start:.2f}s"
+        + (f" ({len(retry_ids)} tokens to retry)" if retry_ids else "")
+    )
+    if retry_ids:
+        raise self.retry(
+            args=(recipient_ids, msg_kwargs),
+            kwargs=dict(coalesce=False, token_ids=sorted(retry_ids)),
+            exc=error,
+        )
+
+
+@app.task
+def notif_flush(recipient_ids: list[int], category: str, flush_at: float):
+    """
+    Sends the notifications held by notif_batch until flush_at, one summary per user.
+    Users with the same held notifications share a notif_batch.
+    """
+    if not settings.NOTIFICATIONS_ENABLED:
+        return
+    groups = {}
+    for user_id, msg_kwargs in notif_coalesce.take_pending(
+        recipient_ids, category, flush_at
+    ).items():
+        key = tuple(sorted((k, str(v)) for k, v in msg_kwargs.items()))
+        groups.setdefault(key, (msg_kwargs, []))[1].append(user_id)
+    for msg_kwargs, user_ids in groups.values():
+        notif_batch.delay(user_ids, msg_kwargs, coalesce=False)
+    logger.info(
+        f"notif_flush: {len(recipient_ids)} users, {len(groups)} distinct summaries"
+    )
+
+
+def deliver_batch(recipient_ids, msg_kwargs, token_ids=None):
+    """
+    Sends msg_kwargs to every token of the recipients that accepts its category,
+    or only to the tokens in token_ids when retrying.
+
+    :returns: The ids of the tokens that should be retried and the last error
+    """
+    tokens = PushToken.eligible(msg_kwargs["category"]).filter(
+        user_id__in=recipient_ids
+    )
+    if token_ids is not None:
+        tokens = tokens.filter(id__in=token_ids)
+    tokens = tokens.only("id", "user_id", "token").order_by("user_id", "id")
+    return publish_batched(push_messages(tokens, msg_kwargs))
+
+
+@app.task
+def reconcile_push_receipts():
+    """
+    Checks the push receipts of accepted messages, which is where Expo reports most delivery failures.
+    Tokens that are no longer registered are deleted, other failures are counted on the token,
+    and the results are added to the delivery statistics.
+    Receipts that are not available yet are checked on the next run, until NOTIF_RECEIPT_TTL.
+    """
+    if not settings.NOTIFICATIONS_ENABLED or settings.NOTIF_DRY_RUN:
+        return
+    start = time.monotonic()
+    now = timezone.now()
+    client = expo_client()
+    pending = (
+        PendingPushReceipt.objects.filter(
+            sent_at__lte=now - settings.NOTIF_RECEIPT_DELAY
+        )
+        .order_by("id")
+        .values_list("id", "ticket_id", "push_token_id", "sent_at")
+    )
+    counts = dict(delivered=0, failed=0, unregistered=0, expired=0)
+    last_id = 0
+    # keyset pagination, as checked receipts are deleted along the way
+    while batch := list(pending.filter(id__gt=last_id)[: client.max_receipt_count]):
+        last_id = batch[-1][0]
         try:
-            resp.validate_response()
-        except DeviceNotRegisteredError:
-            notreg_tokens.add(token)
-        except PushTicketError as exc:
-            raise self.retry(exc=exc)
-    if notreg_tokens:
-        u = User.objects.filter(id=recipient_id).first()
-        for token in notreg_tokens:
-            del u.expo_notif_tokens[token]
-        u.save()
+            receipts = client.check_receipts_multiple(
+                [
+                    PushTicket(
+                        push_message=None,
+                        status=PushTicket.SUCCESS_STATUS,
+                        message="",
+                        details=None,
+                        id=ticket_id,
+                    )
+                    for _, ticket_id, _, _ in batch
+                ]
+            )
+        except (ConnectionError, HTTPError, Timeout, PushServerError) as exc:
+            logger.warning(
+                f"reconcile_push_receipts: failed to fetch receipts, retrying next run: {exc}"
+            )
+            break
+        receipts = {receipt.id: receipt for receipt in receipts}
+
+        checked, failed, notreg = [], [], []
+        for pending_id, ticket_id, push_token_id, sent_at in batch:
+            receipt = receipts.get(ticket_id)
+            if receipt is None:
+                if sent_at < now - settings.NOTIF_RECEIPT_TTL:
+                    checked.append(pending_id)
+                    counts["expired"] += 1
+                continue
+            checked.append(pending_id)
+            try:
+                receipt.validate_response()
+            except DeviceNotRegisteredError:
+                notreg.append(push_token_id)
+            except PushTicketError:
+                failed.append(push_token_id)
+            else:
+                counts["delivered"] += 1
+        counts["failed"] += len(failed)
+        counts["unregistered"] += len(notreg)
+
+        PendingPushReceipt.objects.filter(id__in=checked).delete()
+        if failed:
+            PushToken.objects.filter(id__in=failed).update(
+                failure_count=F("failure_count") + 1
+            )
+        if notreg:
+            PushToken.objects.filter(id__in=notreg).delete()
+
+    PushDeliveryStats.record(**counts)
+    logger.info(f"reconcile_push_receipts: {counts} in {time.monotonic() - start:.2f}s")
 
 
 def load_client() -> tuple[gspread.Client | None, str | None, bool]:
@@ -292,6 +586,29 @@ def load_client() -> tuple[gspread.Client | None, str | None, bool]:
         return (None, "No file to load client from", True)
 
 
+ANNOUNCEMENTS_SHEET_HEADER = [
+    "Timestamp",
+    "Email Address",
+    "Today's Date",
+    "Student Name (First and Last Name), if applicable.",
+    "Staff Advisor",
+    "Club",
+    "Start Date announcement is to be read (max. 3 consecutive school days).",
+    "End Date announcement is to be read",
+    "Announcement to be read (max 75 words)",
+]
+
+
+def trim_row(row: list[str]) -> list[str]:
+    """
+    Strips every cell of a sheet row and drops the empty cells at its end.
+    """
+    data = [value.strip() for value in row]
+    while data and not data[-1]:
+        data.pop()
+    return data
+
+
 @app.task
 def fetch_announcements():
     if settings.GOOGLE_SHEET_KEY == "" or settings.GOOGLE_SHEET_KEY is None:
@@ -308,54 +625,59 @@ def fetch_announcements():
 
         return
 
-    worksheet = None
-
     try:
         worksheet = client.open_by_key(settings.GOOGLE_SHEET_KEY).sheet1
     except Exception:
         logger.warning("Fetch Announcements: Failed to open google sheet")
         return
 
-    row_counter = 1
-    while True:
-        data = []
+    try:
+        # one request for the whole sheet, instead of one per row
+        rows = worksheet.get_all_values()
+    except Exception:
+        logger.warning("Fetch Announcements: Failed to read the sheet")
+        return
+
+    # get_all_values pads every row to the widest one, so a stray cell anywhere widens them all
+    rows = [trim_row(row) for row in rows]
+    if not rows or rows[0] != ANNOUNCEMENTS_SHEET_HEADER:
+        logger.warning("Fetch Announcements: Header row does not match")
+        return
 
+    announcements = {}
+    for row_counter, data in enumerate(rows[1:], start=2):
+        if not data:
+            break
         try:
-            data = [value.strip() for value in worksheet.row_values(row_counter)]
+            parsed_data = {
+                "organization": data[5],
+                "start_date": dt.datetime.strptime(data[6], "%m/%d/%Y").date(),
+                "end_date": dt.datetime.strptime(data[7], "%m/%d/%Y").date(),
+                "content": data[8],
+            }
         except Exception:
-            logger.warning(f"Fetch Announcements: Failed to read row {row_counter}")
-            break
-
-        if row_counter == 1:
-            if data != [
-                "Timestamp",
-                "Email Address",
-                "Today's Date",
-                "Student Name (First and Last Name), if applicable.",
-                "Staff Advisor",
-                "Club",
-                "Start Date announcement is to be read (max. 3 consecutive school days).",
-                "End Date announcement is to be read",
-                "Announcement to be read (max 75 words)",
-            ]:
-                logger.warning("Fetch Announcements: Header row does not match")
-                break
-        else:
-            if data == []:
-                break
-            else:
-                try:
-                    parsed_data = {
-                        "organization": data[5],
-                        "start_date": dt.datetime.strptime(data[6], "%m/%d/%Y"),
-                        "end_date": dt.datetime.strptime(data[7], "%m/%d/%Y"),
-                        "content": data[8],
-                    }
-
-                    DailyAnnouncement.objects.get_or_create(**parsed_data)
-                except Exception:
-                    logger.warning(
-                        f"Fetch Announcements: Failed to parse or create object for row {row_counter}"
-                    )
+            logger.warning(f"Fetch Announcements: Failed to parse row {row_counter}")
+            continue
+        source_hash = DailyAnnouncement.hash_source(**parsed_data)
+        announcements[source_hash] = DailyAnnouncement(
+            source_hash=source_hash, **parsed_data
+        )
 
-        row_counter += 1
+    imported = set(
+        DailyAnnouncement.objects.filter(
+            source_hash__in=list(announcements)
+        ).values_list("source_hash", flat=True)
+    )
+    # ignore_conflicts covers rows imported by a concurrent run
+    DailyAnnouncement.objects.bulk_create(
+        (
+            announcement
+            for source_hash, announcement in announcements.items()
+            if source_hash not in imported
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    logger.info(
+        f"Fetch Announcements: {len(announcements) - len(imported)} new of {len(announcements)} rows"
+    )
@@ -1,57 +1,55 @@
 from django import template
-from django.conf import settings
+from django.core.cache import cache
 from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from ..models.timetable import TIMETABLE_GRID_CACHE_TIMEOUT
 
 register = template.Library()
 
 
 @register.filter
 def render_timetable(timetable):
-    timetable_format = timetable.term.timetable_format
-    timetable_config = settings.TIMETABLE_FORMATS[timetable_format]
+    """
+    Renders the grid of a timetable, which is cached until its courses change.
+    """
+    schedule_format = timetable.term.day_schedule_format()
+    key = timetable.grid_cache_key(schedule_format)
+    html = cache.get(key)
+    if html is None:
+        html = build_timetable_grid(
+            timetable.term.compiled_format,
+            schedule_format,
+            timetable.course_resolver(),
+        )
+        cache.set(key, str(html), TIMETABLE_GRID_CACHE_TIMEOUT)
+    return mark_safe(html)
 
-    courses = {}
-    for i in timetable.courses.all():
-        courses[i.position] = i
 
-    html = format_html(
+def build_timetable_grid(timetable_config, schedule_format, resolver):
+    return format_html(
         '<table class="table"><thead><tr><th scope="col">Period</th>{}</tr></thead><tbody>{}</tbody></table>',
         format_html_join(
             "",
-            '<th scope="col">{} {}</th>',
-            (
-                (timetable_config["cycle"]["duration"].title(), schedule_cycle)
-                for schedule_cycle in range(1, timetable_config["cycle"]["length"] + 1)
-            ),
+            '<th scope="col">{}</th>',
+            ((cycle_label,) for cycle_label in timetable_config.cycle_labels),
         ),
         format_html_join(
             "",
             '<tr><th scope="row">{}</th>{}</tr>',
             (
                 (
-                    schedule_day["description"]["time"].lower(),
+                    period.description["time"].lower(),
                     format_html_join(
                         "",
                         "<td>{}</td>",
                         (
-                            (
-                                (
-                                    courses[
-                                        position_day.intersection(courses.keys()).pop()
-                                    ]
-                                    if position_day.intersection(courses.keys())
-                                    else "-"
-                                ),
-                            )
-                            for position_day in schedule_day["position"]
+                            (resolver.resolve(position_mask) or "-",)
+                            for position_mask in period.position_masks
                         ),
                     ),
                 )
-                for schedule_day in timetable_config["schedules"][
-                    timetable.term.day_schedule_format()
-                ]
+                for period in timetable_config.schedules[schedule_format]
             ),
         ),
     )
-
-    return html
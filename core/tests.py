@@ -1,9 +1,15 @@
 import datetime
+import itertools
+from contextlib import redirect_stdout
+from io import StringIO
 
 import pytz
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 
 class MetropolisBaseTests(TestCase):
@@ -127,3 +133,216 @@ class ChoicesTests(TestCase):
         from core.models.choices import calculate_graduating_year_choices
 
         self.assertEqual(calculate_graduating_year_choices(), self.expected)
+
+
+def migrate_groups_per_user():
+    """
+    The per-user implementation of scripts.migrations.migrate_groups, as a reference for its counters.
+    """
+    User = get_user_model()
+    groups = {
+        "owner": Group.objects.get(name="Org Owners"),
+        "exec": Group.objects.get(name="Execs"),
+        "supervisor": Group.objects.get(name="Supervisors"),
+    }
+    count = {
+        name: {"added": 0, "removed": 0}
+        for name in ("exec", "supervisor", "owner", "staff")
+    }
+
+    def set_group(user, name, member):
+        if member and not user.groups.filter(pk=groups[name].pk).exists():
+            user.groups.add(groups[name])
+            count[name]["added"] += 1
+        elif not member and user.groups.filter(pk=groups[name].pk).exists():
+            user.groups.remove(groups[name])
+            count[name]["removed"] += 1
+
+    def set_staff(user, staff):
+        if staff and not user.is_staff:
+            count["staff"]["added"] += 1
+        elif not staff:
+            if not (user.is_staff and not user.is_superuser and not user.is_teacher):
+                return
+            count["staff"]["removed"] += 1
+        user.is_staff = staff
+        user.save()
+
+    for user in User.objects.all():
+        if user.is_teacher:
+            set_staff(user, True)
+        supervising = user.organizations_supervising.exists()
+        set_group(user, "supervisor", user.is_teacher and supervising)
+        leading = user.organizations_leading.exists()
+        set_staff(user, leading)
+        set_group(user, "exec", leading)
+        owning = user.organizations_owning.exists()
+        if owning or not leading:
+            set_staff(user, owning)
+        set_group(user, "owner", owning)
+    return count
+
+
+class MigrateGroupsTests(TestCase):
+    def setUp(self):
+        from core.models import Organization
+
+        User = get_user_model()
+        groups = [
+            Group.objects.create(name=name)
+            for name in ("Org Owners", "Execs", "Supervisors")
+        ]
+        # every combination of flags, relations and current memberships
+        self.combinations = list(itertools.product((False, True), repeat=9))
+        users = User.objects.bulk_create(
+            User(
+                username=f"user{i}",
+                is_teacher=flags[0],
+                is_staff=flags[1],
+                is_superuser=flags[2],
+            )
+            for i, flags in enumerate(self.combinations)
+        )
+        orgs = Organization.objects.bulk_create(
+            Organization(owner=user, name=user.username, slug=user.username)
+            for user, flags in zip(users, self.combinations)
+            if flags[5]
+        )
+        org = orgs[0]
+        org.supervisors.through.objects.bulk_create(
+            org.supervisors.through(organization=org, user=user)
+            for user, flags in zip(users, self.combinations)
+            if flags[3]
+        )
+        org.execs.through.objects.bulk_create(
+            org.execs.through(organization=org, user=user)
+            for user, flags in zip(users, self.combinations)
+            if flags[4]
+        )
+        User.groups.through.objects.bulk_create(
+            User.groups.through(user=user, group=group)
+            for user, flags in zip(users, self.combinations)
+            for group, member in zip(groups, flags[6:])
+            if member
+        )
+
+    def state(self):
+        User = get_user_model()
+        return sorted(
+            (user.username, user.is_staff, sorted(g.name for g in user.groups.all()))
+            for user in User.objects.prefetch_related("groups")
+        )
+
+    def test_matches_per_user_implementation(self):
+        from scripts.migrations import migrate_groups
+
+        class Rollback(Exception):
+            pass
+
+        try:
+            with transaction.atomic():
+                expected_count = migrate_groups_per_user()
+                expected_state = self.state()
+                raise Rollback
+        except Rollback:
+            pass
+
+        with redirect_stdout(StringIO()), self.assertNumQueries(21):
+            count = migrate_groups()
+        self.assertEqual(count, expected_count)
+        self.assertEqual(self.state(), expected_state)
+
+
+class DeleteExpiredUsersTests(TestCase):
+    def setUp(self):
+        from core.models import Organization, PushToken, Tag
+        from core.utils.test_posts import create_blog_post, create_comment
+
+        User = get_user_model()
+        long_ago = timezone.now() - datetime.timedelta(days=30)
+        self.owner = User.objects.create(username="owner")
+        org = Organization.objects.create(owner=self.owner, name="Org", slug="org")
+        tag = Tag.objects.create(name="tag")
+        blog = create_blog_post(self.owner, "Blog")
+        self.expired = []
+        for i in range(5):
+            user = User.objects.create(
+                username=f"expired{i}",
+                email=f"expired{i}@example.com",
+                bio="Bio",
+                is_deleted=True,
+                last_login=long_ago,
+            )
+            user.organizations.add(org)
+            user.tags_following.add(tag)
+            user.saved_blogs.add(blog)
+            PushToken.objects.create(user=user, token=f"token{i}")
+            create_comment(user, blog, "Comment")
+            self.expired.append(user)
+        self.recent = User.objects.create(
+            username="recent", is_deleted=True, last_login=timezone.now()
+        )
+        self.recent.organizations.add(org)
+
+    @override_settings(DELETE_EXPIRED_USERS_CHUNK_SIZE=2)
+    def test_scrubs_in_chunks(self):
+        from core.models import Comment, PushToken
+        from core.tasks import delete_expired_users
+
+        delete_expired_users()
+        User = get_user_model()
+        scrubbed = User.objects.filter(pk__in=[u.pk for u in self.expired])
+        usernames = set(scrubbed.values_list("username", flat=True))
+        self.assertEqual(len(usernames), 5)
+        for user in scrubbed:
+            self.assertTrue(user.username.startswith("deleted-"))
+            self.assertEqual(user.email, f"{user.username}@maclyonsden.com")
+            self.assertEqual((user.first_name, user.bio), ("Deleted", ""))
+            self.assertFalse(user.organizations.exists())
+            self.assertFalse(user.tags_following.exists())
+            self.assertFalse(user.saved_blogs.exists())
+        self.assertFalse(PushToken.objects.exists())
+        self.assertFalse(Comment.objects.exclude(body=None).exists())
+        self.assertTrue(self.recent.organizations.exists())
+        self.assertEqual(User.objects.get(pk=self.recent.pk).username, "recent")
+
+        # scrubbed users are not scrubbed again
+        delete_expired_users()
+        self.assertEqual(set(scrubbed.values_list("username", flat=True)), usernames)
+
+
+class ProviderRegistryTests(TestCase):
+    def test_lookup_fields_are_stable(self):
+        from core.api.v3.objects import BlogPostProvider
+
+        User = get_user_model()
+        User.objects.create_superuser(username="testuser", password="verysecure")
+        self.client.login(username="testuser", password="verysecure")
+        for _ in range(3):
+            response = self.client.get(
+                "/api/v3/obj/blog-post/retrieve/1", {"lookup": "title"}
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(BlogPostProvider.additional_lookup_fields, ("slug",))
+        self.assertEqual(BlogPostProvider.lookup_fields, {"slug", "id"})
+
+    def test_providers_are_frozen(self):
+        from core.api.v3.objects import AnnouncementProvider
+
+        with self.assertRaises(TypeError):
+            AnnouncementProvider.listing_filters["title"] = str
+        with self.assertRaises(TypeError):
+            AnnouncementProvider.raw_serializers["list"] = None
+
+    def test_invalid_provider_fails_when_defined(self):
+        from core.api.v3.objects.base import BaseProvider
+        from core.models import Tag
+
+        with self.assertRaises(AttributeError):
+
+            class Provider(BaseProvider):
+                model = Tag
+                raw_serializers = {"lst": None}
+
+                def get_queryset(self, request):
+                    return Tag.objects.all()
@@ -2,5 +2,7 @@
 from .file_upload import *
 from .generate_slam import *
 from .get_schedule import *
+from .interval_index import *
 from .local_date import *
 from .tag_color import *
+from .timetable_formats import *
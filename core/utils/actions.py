@@ -8,7 +8,7 @@ from django.utils.translation import gettext_lazy as __
 from django.utils.translation import ngettext
 
 from core.models import Announcement, Organization, Post, User
-from core.tasks import notif_events_singleday, notif_single
+from core.tasks import notif_batch, notif_events_singleday
 from core.utils.announcements import request_announcement_approval
 from core.utils.ratelimiting import admin_action_rate_limit
 
@@ -101,15 +101,15 @@ def resend_approval_email(modeladmin, request, queryset: QuerySet[Announcement])
 # Users / Notifications
 @admin.action(permissions=["change"], description=__("Send test notification"))
 def send_test_notif(modeladmin, request, queryset):
-    for u in queryset:
-        notif_single.delay(
-            u.id,
-            dict(
-                title="Test Notification",
-                body="Test body.",
-                category="test",
-            ),
-        )
+    notif_batch.delay(
+        list(queryset.values_list("id", flat=True)),
+        dict(
+            title="Test Notification",
+            body="Test body.",
+            category="test",
+        ),
+        coalesce=False,
+    )
 
 
 @admin.action(permissions=["change"], description=__("Send singleday notification"))
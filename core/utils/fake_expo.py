@@ -0,0 +1,287 @@
+"""
+Stand-in for the Expo push service, for tests and local load testing.
+
+FakeExpo implements the two endpoints we use (/push/send and /push/getReceipts), with optional latency and
+error injection. It can be reached in two ways:
+- FakeExpo.mounted() routes a host of a requests session to it in-process, without any network.
+- FakeExpoServer serves it over HTTP (see the fake_expo_server management command).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import itertools
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+
+TOKEN_PREFIX = "ExponentPushToken["
+TOKEN_SUFFIX = "]"
+
+
+def device_not_registered(to: str) -> dict:
+    return {
+        "status": "error",
+        "message": f'"{to}" is not a registered push notification recipient',
+        "details": {"error": "DeviceNotRegistered"},
+    }
+
+
+@dataclass
+class Reply:
+    status: int
+    body: dict
+    delay: float = 0.0  # seconds to wait before replying
+    timed_out: bool = False  # never reply in time
+
+
+class FakeExpo:
+    """
+    rejected tokens fail with DeviceNotRegistered in the ticket itself,
+    unregistered tokens are accepted and only fail in their push receipt.
+    Tokens are given without the ExponentPushToken[...] wrapper.
+
+    Every request waits latency seconds (plus up to jitter more), and fails with a 5xx with probability error_rate
+    or times out with probability timeout_rate.
+    The first time a token is seen, it is made rejected with probability rejected_rate,
+    and otherwise unregistered with probability unregistered_rate.
+    """
+
+    def __init__(
+        self,
+        rejected=(),
+        unregistered=(),
+        rejected_rate=0.0,
+        unregistered_rate=0.0,
+        error_rate=0.0,
+        timeout_rate=0.0,
+        latency=0.0,
+        jitter=0.0,
+        timeout_delay=30.0,
+        seed=None,
+    ):
+        self.rejected = set(rejected)
+        self.unregistered = set(unregistered)
+        self.rejected_rate = rejected_rate
+        self.unregistered_rate = unregistered_rate
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.timeout_delay = timeout_delay
+        self.sent = []  # every message accepted, in order
+        self.receipts = {}  # ticket id -> receipt
+        self.requests = []  # (endpoint, number of items) of every request answered
+        self._seen = set()
+        self._ids = itertools.count(1)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def handle(self, path: str, payload) -> Reply:
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fault = self._rng.random()
+            if fault < self.timeout_rate:
+                return Reply(504, {}, self.timeout_delay, timed_out=True)
+            if fault < self.timeout_rate + self.error_rate:
+                return Reply(
+                    503,
+                    {
+                        "errors": [
+                            {
+                                "code": "INTERNAL_SERVER_ERROR",
+                                "message": "An unknown error occurred.",
+                            }
+                        ]
+                    },
+                    delay,
+                )
+
+            if path.endswith("/push/send"):
+                messages = payload if isinstance(payload, list) else [payload]
+                self.requests.append(("send", len(messages)))
+                return Reply(
+                    200, {"data": [self._send(message) for message in messages]}, delay
+                )
+            if path.endswith("/push/getReceipts"):
+                ids = payload["ids"]
+                self.requests.append(("getReceipts", len(ids)))
+                return Reply(
+                    200,
+                    {
+                        "data": {
+                            ticket_id: self.receipts[ticket_id]
+                            for ticket_id in ids
+                            if ticket_id in self.receipts
+                        }
+                    },
+                    delay,
+                )
+        return Reply(404, {"errors": [{"code": "NOT_FOUND", "message": path}]})
+
+    def _send(self, message: dict) -> dict:
+        to = message["to"]
+        token = to.removeprefix(TOKEN_PREFIX).removesuffix(TOKEN_SUFFIX)
+        if token not in self._seen:
+            self._seen.add(token)
+            if self._rng.random() < self.rejected_rate:
+                self.rejected.add(token)
+            elif self._rng.random() < self.unregistered_rate:
+                self.unregistered.add(token)
+        if token in self.rejected:
+            return device_not_registered(to)
+        ticket_id = f"ticket-{next(self._ids)}"
+        self.sent.append(message)
+        self.receipts[ticket_id] = (
+            device_not_registered(to)
+            if token in self.unregistered
+            else {"status": "ok"}
+        )
+        return {"status": "ok", "id": ticket_id}
+
+    @contextlib.contextmanager
+    def mounted(self, session: requests.Session, host: str):
+        """
+        Routes the requests of session to host through this stand-in while in the context.
+        """
+        adapters = dict(session.adapters)
+        session.mount(host, FakeExpoAdapter(self))
+        try:
+            yield self
+        finally:
+            session.adapters.clear()
+            session.adapters.update(adapters)
+
+
+class FakeExpoAdapter(BaseAdapter):
+    def __init__(self, expo: FakeExpo):
+        super().__init__()
+        self.expo = expo
+
+    def send(self, request, timeout=None, **kwargs):
+        reply = self.expo.handle(
+            urlsplit(request.url).path, json.loads(request.body or "null")
+        )
+        if reply.timed_out:
+            raise requests.exceptions.ReadTimeout(request=request)
+        time.sleep(reply.delay)
+        response = requests.Response()
+        response.status_code = reply.status
+        response.headers["content-type"] = "application/json"
+        response._content = json.dumps(reply.body).encode()
+        response.raw = BytesIO(response._content)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeExpoRequestHandler(BaseHTTPRequestHandler):
+    server: FakeExpoServer
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length") or 0)
+        reply = self.server.expo.handle(
+            urlsplit(self.path).path, json.loads(self.rfile.read(length) or "null")
+        )
+        time.sleep(reply.delay)
+        body = json.dumps(reply.body).encode()
+        try:
+            self.send_response(reply.status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up waiting
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeExpoServer(ThreadingHTTPServer):
+    """
+    Serves a FakeExpo over HTTP. Port 0 picks a free port.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, expo: FakeExpo, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeExpoRequestHandler)
+        self.expo = expo
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def add_fake_expo_arguments(parser):
+    """
+    Adds the latency and error injection options of FakeExpo to a management command.
+    """
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds every request takes."
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.05,
+        help="Up to this many more seconds, at random.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Probability of a request failing with a 503.",
+    )
+    parser.add_argument(
+        "--timeout-rate",
+        type=float,
+        default=0.0,
+        help="Probability of a request never being answered in time.",
+    )
+    parser.add_argument(
+        "--unregistered-rate",
+        type=float,
+        default=0.0,
+        help="Probability of a token failing with DeviceNotRegistered in its push receipt.",
+    )
+    parser.add_argument(
+        "--rejected-rate",
+        type=float,
+        default=0.0,
+        help="Probability of a token failing with DeviceNotRegistered in its ticket.",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def fake_expo_from_options(options, timeout_delay=30.0) -> FakeExpo:
+    """
+    Builds a FakeExpo from the options added by add_fake_expo_arguments.
+    """
+    return FakeExpo(
+        rejected_rate=options["rejected_rate"],
+        unregistered_rate=options["unregistered_rate"],
+        error_rate=options["error_rate"],
+        timeout_rate=options["timeout_rate"],
+        latency=options["latency"],
+        jitter=options["jitter"],
+        timeout_delay=timeout_delay,
+        seed=options["seed"],
+    )
@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.utils.safestring import SafeString, mark_safe
 
 from .. import models
+from .local_date import date_range
 
 
 @dataclass
@@ -50,22 +51,48 @@ def get_day_schedule(user, target_date: datetime.datetime) -> DaySchedule:
     return personal_sch
 
 
+def generic_day_schedules(dates) -> dict:
+    """
+    Returns the generic day schedule of every date in dates, computing each term's days in one range.
+    """
+    dates_by_term = {}
+    for target_date in dates:
+        term = models.Term.get_current(target_date=target_date)
+        dates_by_term.setdefault(term, []).append(target_date)
+
+    result = {}
+    for term, term_dates in dates_by_term.items():
+        schedules = (
+            term.day_schedule_range(term_dates[0], term_dates[-1])
+            if term is not None
+            else {}
+        )
+        for target_date in term_dates:
+            schedule = schedules.get(target_date, [])
+            # generic day schedule is personal if it is empty
+            result[target_date] = DaySchedule(schedule, len(schedule) == 0)
+    return result
+
+
 def get_week_schedule(user) -> dict:
     date = timezone.localdate()
+    dates = date_range(date, date + datetime.timedelta(days=6))
 
     if user.is_authenticated:
+        personal_schs = user.schedule_range(dates[0], dates[-1])
+        # generic schedule is more useful than an empty personal one
+        generic_schs = generic_day_schedules(
+            [target_date for target_date in dates if not personal_schs[target_date]]
+        )
         return {
-            target_date.isoformat(): get_day_schedule(user, target_date)
-            for target_date in [
-                date + datetime.timedelta(days=days) for days in range(7)
-            ]
+            target_date.isoformat(): generic_schs.get(
+                target_date, DaySchedule(personal_schs[target_date], True)
+            )
+            for target_date in dates
         }
     return {
-        target_date.isoformat(): generic_day_schedule(
-            models.Term.get_current(target_date=target_date),
-            target_date,
-        )
-        for target_date in [date + datetime.timedelta(days=days) for days in range(7)]
+        target_date.isoformat(): day_schedule
+        for target_date, day_schedule in generic_day_schedules(dates).items()
     }
 
 
@@ -0,0 +1,57 @@
+"""
+Static interval index for stabbing queries, used to find the events overlapping a day without a query per day.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable
+
+
+class IntervalIndex:
+    """
+    Closed intervals sorted by start, alongside a sorted array of their ends.
+    Counting the intervals overlapping a range takes two binary searches;
+    listing them only scans the intervals starting within the longest interval's length of the range.
+    """
+
+    def __init__(self, intervals: Iterable[tuple[Any, Any, Any]]):
+        # an interval ending before it starts cannot be counted by start and end alone, and Event.clean rejects them
+        items = sorted(
+            (interval for interval in intervals if interval[0] <= interval[1]),
+            key=lambda interval: interval[0],
+        )
+        self.starts = [start for start, _end, _value in items]
+        self.ends_by_start = [end for _start, end, _value in items]
+        self.values = [value for _start, _end, value in items]
+        self.ends = sorted(self.ends_by_start)
+        self.max_length = max(
+            (end - start for start, end, _value in items), default=None
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def count(self, lo, hi, strict=False) -> int:
+        """
+        Counts the intervals overlapping [lo, hi], i.e. start <= hi and end >= lo.
+        With strict, touching endpoints do not count: start < hi and end > lo, which requires lo < hi.
+        """
+        if strict:
+            return bisect_left(self.starts, hi) - bisect_right(self.ends, lo)
+        # every interval ending before lo also starts before hi, so the difference is the overlap
+        return bisect_right(self.starts, hi) - bisect_left(self.ends, lo)
+
+    def overlapping(self, lo, hi, strict=False) -> list:
+        """
+        Returns the values of the intervals overlapping [lo, hi], in order of start.
+        """
+        if not self.starts:
+            return []
+        stop = (bisect_left if strict else bisect_right)(self.starts, hi)
+        first = bisect_left(self.starts, lo - self.max_length)
+        return [
+            self.values[i]
+            for i in range(first, stop)
+            if (self.ends_by_start[i] > lo if strict else self.ends_by_start[i] >= lo)
+        ]
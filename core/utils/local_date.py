@@ -13,3 +13,23 @@ def get_localdate(date=None, time=None):
             datetime.datetime.combine(date, datetime.time(*time))
         )
     return date
+
+
+def to_date(date=None) -> datetime.date:
+    """
+    Like get_localdate, but drops the time of datetimes.
+    """
+    date = get_localdate(date=date)
+    if isinstance(date, datetime.datetime):
+        return date.date()
+    return date
+
+
+def date_range(start_date, end_date):
+    """
+    Returns every date from start_date to end_date (inclusive).
+    """
+    return [
+        start_date + datetime.timedelta(days=days)
+        for days in range((end_date - start_date).days + 1)
+    ]
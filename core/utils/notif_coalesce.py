@@ -0,0 +1,199 @@
+"""
+Per-user coalescing and rate limiting of push notifications, kept in the cache.
+
+The first notification of a category opens a window of NOTIF_COALESCE_WINDOW for that user.
+Notifications arriving while the window is open, or while the user is over NOTIF_USER_RATE_LIMIT,
+are held and sent as one summary ("3 new announcements") when the window closes.
+
+Every change to the state of a user is a single atomic cache operation, so concurrent notif_batch chunks
+that share users cannot overwrite each other:
+the window is opened with cache.add, counters are bumped with cache.incr,
+and held notifications are appended to a batch named after the time it is flushed at.
+A held notification takes a slot in its batch by incrementing the batch's count, and the flush seals the batch
+by adding SEALED to that count before reading it; a notification that finds its batch sealed is sent right away.
+Nothing is lost: the worst case is an extra push, or a summary that is missing a title
+if the flush reads a slot before the notification that took it has been written.
+"""
+
+from __future__ import annotations
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import ngettext
+
+WINDOW_KEY = "notif_window:{}:{}"
+HELD_COUNT_KEY = "notif_held:{}:{}:{:.3f}"
+HELD_MESSAGE_KEY = "notif_held:{}:{}:{:.3f}:{}"
+RATE_COUNT_KEY = "notif_rate:{}:{}"
+SUMMARY_MAX_TITLES = 5
+SEALED = 1 << 30  # added to the count of a batch once it is flushed
+
+
+def window_seconds(category: str) -> float:
+    window = settings.NOTIF_COALESCE_WINDOW
+    if not window or category not in settings.NOTIF_COALESCE_CATEGORIES:
+        return 0.0
+    return window.total_seconds()
+
+
+def rate_limit() -> tuple[int, float] | None:
+    if settings.NOTIF_USER_RATE_LIMIT is None:
+        return None
+    count, period = settings.NOTIF_USER_RATE_LIMIT
+    return count, period.total_seconds()
+
+
+def increment(key: str, timeout: int) -> int:
+    if cache.add(key, 1, timeout=timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:  # expired in between
+        return increment(key, timeout)
+
+
+def count_sent(user_id: int, period: float, now: float) -> int:
+    return increment(
+        RATE_COUNT_KEY.format(user_id, int(now // period)), int(period) + 1
+    )
+
+
+def open_window(user_id: int, category: str, window: float, now: float) -> float | None:
+    """
+    Opens a window for the user, unless one is open already.
+
+    :returns: None if the window was opened, otherwise the time the open window ends at
+    """
+    key = WINDOW_KEY.format(user_id, category)
+    while not cache.add(key, now + window, timeout=int(window) + 1):
+        until = cache.get(key)
+        if until is not None:
+            return until
+    return None
+
+
+def hold(user_id: int, msg_kwargs, flush_at: float, timeout: int) -> bool | None:
+    """
+    Appends a notification to the batch flushed at flush_at.
+
+    :returns: True if it is the first of the batch, so a flush must be scheduled, None if the batch is sealed
+    """
+    category = msg_kwargs["category"]
+    slot = increment(HELD_COUNT_KEY.format(user_id, category, flush_at), timeout)
+    if slot > SEALED:
+        return None
+    if slot <= SUMMARY_MAX_TITLES:
+        cache.set(
+            HELD_MESSAGE_KEY.format(user_id, category, flush_at, slot),
+            msg_kwargs,
+            timeout=timeout,
+        )
+    return slot == 1
+
+
+def coalesce(
+    recipient_ids, msg_kwargs, now: float = None
+) -> tuple[list[int], dict[float, list[int]]]:
+    """
+    Splits recipients into those to notify now and those whose notification is held.
+
+    :returns: The ids to send to, and the held ids that need a flush, by the time it is due
+    """
+    now = time.time() if now is None else now
+    category = msg_kwargs["category"]
+    window = window_seconds(category)
+    limit = rate_limit()
+    if not window and limit is None:
+        return list(recipient_ids), {}
+    timeout = state_timeout(window, limit)
+
+    send, held = [], {}
+    for user_id in recipient_ids:
+        flush_at = open_window(user_id, category, window, now) if window else None
+        if flush_at is None and limit is not None:
+            max_count, period = limit
+            if count_sent(user_id, period, now) > max_count:
+                flush_at = (now // period + 1) * period
+
+        if flush_at is None:
+            send.append(user_id)
+            continue
+        first = hold(user_id, msg_kwargs, flush_at, timeout)
+        if first is None:
+            # the batch was flushed while this notification was on its way
+            send.append(user_id)
+        elif first:
+            held.setdefault(flush_at, []).append(user_id)
+    return send, held
+
+
+def take_pending(
+    recipient_ids, category: str, flush_at: float, now: float = None
+) -> dict[int, dict]:
+    """
+    Seals the batches flushed at flush_at and returns the message to send to each of their recipients.
+    A new window is opened for everyone who is sent something.
+    """
+    now = time.time() if now is None else now
+    window = window_seconds(category)
+    limit = rate_limit()
+    counts = {}
+    for user_id in recipient_ids:
+        try:
+            count = (
+                cache.incr(HELD_COUNT_KEY.format(user_id, category, flush_at), SEALED)
+                - SEALED
+            )
+        except ValueError:  # nothing held, or expired
+            continue
+        if 0 < count < SEALED:  # otherwise, already flushed
+            counts[user_id] = count
+
+    message_keys = {
+        user_id: [
+            HELD_MESSAGE_KEY.format(user_id, category, flush_at, slot)
+            for slot in range(1, min(count, SUMMARY_MAX_TITLES) + 1)
+        ]
+        for user_id, count in counts.items()
+    }
+    held = cache.get_many([key for keys in message_keys.values() for key in keys])
+    messages = {}
+    for user_id, count in counts.items():
+        user_messages = [held[key] for key in message_keys[user_id] if key in held]
+        messages[user_id] = summarize(category, user_messages, count)
+        if window:
+            cache.set(
+                WINDOW_KEY.format(user_id, category),
+                now + window,
+                timeout=int(window) + 1,
+            )
+        if limit is not None:
+            # flushes are not held again, but still count towards the limit
+            count_sent(user_id, limit[1], now)
+    return messages
+
+
+def summarize(category: str, messages: list[dict], count: int) -> dict:
+    if count == 1 and messages:
+        return messages[0]
+    if category.startswith("ann."):
+        title = ngettext(
+            "%(count)d new announcement", "%(count)d new announcements", count
+        )
+    elif category == "blog":
+        title = ngettext("%(count)d new blog post", "%(count)d new blog posts", count)
+    else:
+        title = ngettext(
+            "%(count)d new notification", "%(count)d new notifications", count
+        )
+    body = "\n".join(str(message["title"]) for message in messages)
+    if count > len(messages):
+        body += "\n…"
+    return dict(title=title % dict(count=count), body=body, category=category)
+
+
+def state_timeout(window: float, limit) -> int:
+    # held messages must outlive the longest a flush can be scheduled ahead
+    return int(window + (limit[1] if limit is not None else 0)) + 60
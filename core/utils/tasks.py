@@ -15,3 +15,22 @@ def get_random_username():
     if User.objects.filter(username=username).exists():
         return get_random_username()
     return username
+
+
+def get_random_usernames(count: int) -> list[str]:
+    """
+    Generate count distinct random usernames that are not already taken, checking them in one query per round.
+    """
+    usernames = set()
+    while len(usernames) < count:
+        candidates = {
+            "deleted-" + get_random_string(length=6)
+            for _ in range(count - len(usernames))
+        } - usernames
+        taken = set(
+            User.objects.filter(username__in=candidates).values_list(
+                "username", flat=True
+            )
+        )
+        usernames |= candidates - taken
+    return list(usernames)
@@ -0,0 +1,601 @@
+import datetime
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from django.utils import timezone
+from requests.exceptions import ConnectionError
+
+from core import tasks
+from core.api.utils import notif_stream
+from core.api.utils.notif_stream import InMemoryBroker
+from core.api.views import notifs
+from core.api.views.notifs import NotificationStream, NotifToken
+from core.models import (
+    Announcement,
+    Event,
+    Organization,
+    PendingPushReceipt,
+    PushDeliveryStats,
+    PushToken,
+    Term,
+    User,
+)
+from core.utils import notif_coalesce
+from core.utils.fake_expo import FakeExpo
+
+
+def expo_response(request_data):
+    """
+    Builds an Expo /push/send response, failing tokens that start with "dead" as DeviceNotRegistered.
+    """
+    tickets = []
+    for message in json.loads(request_data):
+        if message["to"].startswith("ExponentPushToken[dead"):
+            tickets.append(
+                {
+                    "status": "error",
+                    "message": f"{message['to']} is not a registered push notification recipient",
+                    "details": {"error": "DeviceNotRegistered"},
+                }
+            )
+        else:
+            tickets.append({"status": "ok", "id": f"ticket-{message['to']}"})
+    return mock.Mock(json=lambda: {"data": tickets}, raise_for_status=lambda: None)
+
+
+@override_settings(
+    NOTIFICATIONS_ENABLED=True, NOTIF_DRY_RUN=False, NOTIF_EXPO_BATCH_SIZE=3
+)
+class TestNotifBatch(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create(username=f"user{i}") for i in range(4)]
+        for i, user in enumerate(self.users):
+            PushToken.register(user, f"live{i}", {})
+            PushToken.register(user, f"dead{i}", None)
+            PushToken.register(user, f"muted{i}", {"allow": {"blog": None}})
+        self.msg = dict(title="Title", body="Body", category="ann.public")
+
+    def send(self, side_effect):
+        with mock.patch.object(tasks.session, "post", side_effect=side_effect) as post:
+            tasks.notif_batch([u.id for u in self.users], self.msg)
+        return post
+
+    def test_batches_messages_across_users(self):
+        post = self.send(lambda url, data, timeout: expo_response(data))
+        # 4 users with 2 allowed tokens each, 3 per request
+        self.assertEqual(post.call_count, 3)
+        sent = [
+            message["to"]
+            for call in post.call_args_list
+            for message in json.loads(call.kwargs["data"])
+        ]
+        self.assertEqual(len(sent), 8)
+        self.assertFalse(any("muted" in to for to in sent))
+
+    def test_prunes_unregistered_tokens(self):
+        self.send(lambda url, data, timeout: expo_response(data))
+        for i, user in enumerate(self.users):
+            self.assertEqual(
+                set(user.push_tokens.values_list("token", flat=True)),
+                {f"live{i}", f"muted{i}"},
+            )
+        live = PushToken.objects.get(token="live0")
+        self.assertIsNotNone(live.last_success)
+        self.assertIsNone(PushToken.objects.get(token="muted0").last_success)
+
+    def test_retries_only_failed_tokens(self):
+        responses = iter([None, ConnectionError(), None])
+
+        def post(url, data, timeout):
+            error = next(responses)
+            if error is not None:
+                raise error
+            return expo_response(data)
+
+        with mock.patch.object(tasks.notif_batch, "retry", side_effect=Exception):
+            with self.assertRaises(Exception):
+                self.send(post)
+            retry = tasks.notif_batch.retry.call_args.kwargs
+        # the second request held dead1, live2 and dead2; live1 went out in the first one
+        retry_tokens = PushToken.objects.filter(id__in=retry["kwargs"]["token_ids"])
+        self.assertEqual(
+            set(retry_tokens.values_list("token", flat=True)),
+            {"dead1", "live2", "dead2"},
+        )
+        self.assertEqual(
+            set(
+                PushToken.objects.filter(failure_count=1).values_list(
+                    "token", flat=True
+                )
+            ),
+            {"dead1", "live2", "dead2"},
+        )
+
+        with mock.patch.object(
+            tasks.session,
+            "post",
+            side_effect=lambda url, data, timeout: expo_response(data),
+        ) as post:
+            tasks.notif_batch(*retry["args"], **retry["kwargs"])
+        self.assertEqual(
+            sorted(
+                message["to"] for message in json.loads(post.call_args.kwargs["data"])
+            ),
+            sorted(f"ExponentPushToken[{t}]" for t in ("dead1", "live2", "dead2")),
+        )
+
+
+class TestFanOut(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f"user{i}") for i in range(7)]
+        for i, user in enumerate(self.users):
+            PushToken.register(user, f"t{i}", {})
+        PushToken.register(
+            User.objects.create(username="blog-only"),
+            "blog-only",
+            {"allow": {"blog": None}},
+        )
+        User.objects.create(username="no-token")
+        self.org = Organization.objects.create(owner=self.users[0], slug="school")
+        self.ann = Announcement.objects.create(
+            organization=self.org,
+            author=self.users[0],
+            title="Title",
+            status="a",
+            show_after=timezone.now(),
+        )
+
+    def test_announcement_fans_out_in_chunks(self):
+        with (
+            override_settings(
+                NOTIFICATIONS_ENABLED=True,
+                ANNOUNCEMENTS_NOTIFY_FEEDS=[self.org.id],
+                NOTIF_FANOUT_CHUNK_SIZE=3,
+            ),
+            mock.patch.object(tasks.notif_batch, "delay") as delay,
+        ):
+            tasks.notif_broker_announcement(self.ann.id)
+        chunks = [call.args[0] for call in delay.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        self.assertEqual(
+            [user_id for chunk in chunks for user_id in chunk],
+            [u.id for u in self.users],
+        )
+        self.assertEqual(delay.call_args.args[1]["category"], "ann.public")
+
+    def test_events_singleday_message(self):
+        term = Term.objects.create(
+            start_date=datetime.date(2024, 9, 3),
+            end_date=datetime.date(2025, 1, 31),
+            timetable_format="2024-2025",
+        )
+        club = Organization.objects.create(owner=self.users[1], slug="club")
+        club.members.add(self.users[1])
+        day = datetime.date(2024, 9, 11)
+        for name, hour, schedule_format, org, is_public in (
+            ("Assembly", 9, "default", self.org, True),
+            ("Late Start", 9, "late-start", self.org, True),
+            ("Club Meeting", 7, "default", club, False),
+            ("Breakfast", 8, "default", club, True),
+        ):
+            start = timezone.make_aware(
+                datetime.datetime.combine(day, datetime.time(hour))
+            )
+            Event.objects.create(
+                name=name,
+                term=term,
+                organization=org,
+                start_date=start,
+                end_date=start + datetime.timedelta(hours=1),
+                schedule_format=schedule_format,
+                is_public=is_public,
+            )
+        with (
+            override_settings(NOTIFICATIONS_ENABLED=True),
+            mock.patch.object(tasks.notif_batch, "delay") as delay,
+        ):
+            tasks.notif_events_singleday(day)
+        delay.assert_called_once()
+        recipient_ids, msg = delay.call_args.args
+        self.assertEqual(recipient_ids, [u.id for u in self.users])
+        self.assertEqual(str(msg["title"]), "Wed Sep 11: Breakfast")
+        self.assertEqual(
+            str(msg["body"]), "3 Events:\n1. Breakfast\n2. Late Start\n3. Assembly\n"
+        )
+
+
+@override_settings(NOTIFICATIONS_ENABLED=True, NOTIF_DRY_RUN=False)
+class TestNotifCoalesce(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create(username=f"user{i}") for i in range(3)]
+        self.ids = [u.id for u in self.users]
+        self.flushes = []
+
+    def send(self, recipient_ids, title, category="ann.public"):
+        msg = dict(title=title, body="Body", category=category)
+        with (
+            mock.patch.object(
+                tasks, "deliver_batch", return_value=(set(), None)
+            ) as deliver,
+            mock.patch.object(tasks.notif_flush, "apply_async") as flush,
+        ):
+            tasks.notif_batch(recipient_ids, msg)
+        sent = deliver.call_args.args[0] if deliver.called else []
+        self.flushes += [call.args[0] for call in flush.call_args_list]
+        held = [user_id for call in flush.call_args_list for user_id in call.args[0][0]]
+        return sent, held
+
+    def flush(self):
+        flushes, self.flushes = self.flushes, []
+        with mock.patch.object(tasks.notif_batch, "delay") as delay:
+            for args in flushes:
+                tasks.notif_flush(*args)
+        return {
+            tuple(call.args[0]): call.args[1]["title"] for call in delay.call_args_list
+        }
+
+    def test_merges_notifications_within_window(self):
+        self.assertEqual(self.send(self.ids[:2], "First"), (self.ids[:2], []))
+        # user 2 has not been notified yet, the others are held until the window closes
+        self.assertEqual(self.send(self.ids, "Second"), ([self.ids[2]], self.ids[:2]))
+        self.assertEqual(self.send(self.ids, "Third"), ([], [self.ids[2]]))
+        self.assertEqual(self.send(self.ids[:1], "Fourth"), ([], []))
+
+        self.assertEqual(
+            self.flush(),
+            {
+                (self.ids[0],): "3 new announcements",
+                (self.ids[1],): "2 new announcements",
+                (self.ids[2],): "Third",
+            },
+        )
+        # flushing opens a new window
+        self.assertEqual(self.send(self.ids[:1], "Fifth"), ([], self.ids[:1]))
+        self.assertEqual(self.flush(), {(self.ids[0],): "Fifth"})
+
+    def test_other_categories_are_not_merged(self):
+        self.send(self.ids, "First")
+        self.assertEqual(
+            self.send(self.ids, "Event", "event.singleday"), (self.ids, [])
+        )
+
+    @override_settings(NOTIF_USER_RATE_LIMIT=(2, datetime.timedelta(hours=1)))
+    def test_rate_limit(self):
+        for title in ("First", "Second"):
+            self.assertEqual(self.send(self.ids, title, "test"), (self.ids, []))
+        self.assertEqual(self.send(self.ids, "Third", "test"), ([], self.ids))
+        self.assertEqual(self.flush(), {tuple(self.ids): "Third"})
+
+    def test_notification_held_during_flush_is_not_lost(self):
+        self.send(self.ids, "First")
+        self.send(self.ids, "Second")
+        get_many, sent = cache.get_many, []
+
+        def racing_get_many(keys):
+            # another broadcast reaches the users while the flush reads their batches
+            msg = dict(title="Third", body="Body", category="ann.public")
+            sent.extend(notif_coalesce.coalesce(self.ids, msg)[0])
+            return get_many(keys)
+
+        flushes = list(self.flushes)
+        with mock.patch.object(cache, "get_many", side_effect=racing_get_many):
+            self.assertEqual(self.flush(), {tuple(self.ids): "Second"})
+        # the batch was sealed before it was read, so the late notification went out on its own
+        self.assertEqual(sent, self.ids)
+        # a flush that runs twice sends nothing the second time
+        self.flushes = flushes
+        self.assertEqual(self.flush(), {})
+
+
+class TestNotifToken(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user")
+        self.factory = APIRequestFactory()
+
+    def request(self, method, data):
+        request = getattr(self.factory, method)(
+            "/api/v3/notif/token", data, format="json"
+        )
+        force_authenticate(request, user=self.user)
+        return NotifToken.as_view()(request)
+
+    def test_put_and_delete(self):
+        self.request(
+            "put",
+            {
+                "expo_push_token": "ExponentPushToken[abc123]",
+                "options": {"allow": {"blog": None, "ann.public": None}},
+            },
+        )
+        push_token = self.user.push_tokens.get()
+        self.assertEqual(push_token.token, "abc123")
+        self.assertFalse(push_token.allow_all)
+        self.assertEqual(PushToken.eligible("blog").get(), push_token)
+        self.assertFalse(PushToken.eligible("ann.personal").exists())
+
+        # updating the options replaces the allowlist
+        self.request("put", {"expo_push_token": "abc123", "options": {}})
+        push_token = self.user.push_tokens.get()
+        self.assertTrue(push_token.allow_all)
+        self.assertFalse(push_token.allowed_categories.exists())
+
+        self.request("delete", {"expo_push_token": "abc123", "options": {}})
+        self.assertFalse(self.user.push_tokens.exists())
+
+
+@override_settings(
+    NOTIFICATIONS_ENABLED=True,
+    NOTIF_DRY_RUN=False,
+    NOTIF_EXPO_HOST="http://expo.test",
+    NOTIF_RECEIPT_DELAY=datetime.timedelta(0),
+)
+class TestReconcilePushReceipts(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="user")
+        for token in ("live", "gone", "rejected"):
+            PushToken.register(self.user, token, {})
+        self.expo = FakeExpo(rejected={"rejected"}, unregistered={"gone"})
+        self.msg = dict(title="Title", body="Body", category="ann.public")
+
+    def test_prunes_tokens_reported_in_receipts(self):
+        with self.expo.mounted(tasks.session, "http://expo.test"):
+            tasks.notif_batch([self.user.id], self.msg)
+            self.assertEqual(
+                set(self.user.push_tokens.values_list("token", flat=True)),
+                {"live", "gone"},
+            )
+            self.assertEqual(PendingPushReceipt.objects.count(), 2)
+
+            with mock.patch.object(PushDeliveryStats, "record") as record:
+                tasks.reconcile_push_receipts()
+            record.assert_called_once_with(
+                delivered=1, failed=0, unregistered=1, expired=0
+            )
+        self.assertEqual(
+            list(self.user.push_tokens.values_list("token", flat=True)), ["live"]
+        )
+        self.assertFalse(PendingPushReceipt.objects.exists())
+        self.assertEqual(self.expo.requests, [("send", 3), ("getReceipts", 2)])
+
+    def test_keeps_receipts_until_available(self):
+        with self.expo.mounted(tasks.session, "http://expo.test"):
+            tasks.notif_batch([self.user.id], self.msg)
+            self.expo.receipts.clear()
+            tasks.reconcile_push_receipts()
+            self.assertEqual(PendingPushReceipt.objects.count(), 2)
+
+            with override_settings(NOTIF_RECEIPT_TTL=datetime.timedelta(0)):
+                tasks.reconcile_push_receipts()
+        self.assertFalse(PendingPushReceipt.objects.exists())
+        stats = PushDeliveryStats.objects.get()
+        self.assertEqual((stats.sent, stats.unregistered, stats.expired), (2, 1, 2))
+
+    def test_server_errors_and_timeouts_are_retried(self):
+        for expo in (FakeExpo(error_rate=1), FakeExpo(timeout_rate=1)):
+            with expo.mounted(tasks.session, "http://expo.test"):
+                retry_ids, error = tasks.deliver_batch([self.user.id], self.msg)
+            self.assertEqual(
+                retry_ids, set(self.user.push_tokens.values_list("id", flat=True))
+            )
+            self.assertIsNotNone(error)
+        self.assertEqual(
+            set(self.user.push_tokens.values_list("failure_count", flat=True)),
+            {2},
+        )
+
+
+class TestBenchmarkNotifs(TestCase):
+    def test_runs_and_rolls_back(self):
+        out = StringIO()
+        call_command(
+            "benchmark_notifs",
+            users=5,
+            tokens=2,
+            latency=0,
+            jitter=0,
+            receipts=True,
+            stdout=out,
+        )
+        self.assertIn("messages accepted  10", out.getvalue())
+        self.assertFalse(User.objects.exists())
+
+    def test_rejected_rate(self):
+        out = StringIO()
+        call_command(
+            "benchmark_notifs",
+            users=5,
+            tokens=2,
+            latency=0,
+            jitter=0,
+            rejected_rate=1,
+            stdout=out,
+        )
+        self.assertIn("messages accepted  0", out.getvalue())
+        self.assertIn("tokens rejected    10", out.getvalue())
+
+
+class TestNotificationStream(TestCase):
+    def setUp(self):
+        self.broker = InMemoryBroker()
+        self.user = User.objects.create(username="user")
+        self.org = Organization.objects.create(owner=self.user, slug="org")
+
+    def test_events_are_delivered_in_order(self):
+        stream = NotificationStream(self.broker)
+        self.assertEqual(next(stream), b"event: init\ndata: {}\n\n")
+        for i in range(3):
+            self.broker.publish("test", {"i": i})
+        self.assertEqual(
+            [next(stream) for _ in range(3)],
+            [
+                f'id: {i + 1}\nevent: test\ndata: {{"i": {i}}}\n\n'.encode()
+                for i in range(3)
+            ],
+        )
+        stream.close()
+        self.assertFalse(self.broker.subscribers)
+
+    @override_settings(NOTIF_STREAM_HISTORY=3, NOTIF_STREAM_HEARTBEAT_SECS=0)
+    def test_replays_from_last_event_id(self):
+        self.broker = InMemoryBroker()
+        for i in range(5):
+            self.broker.publish("test", {"i": i})
+        stream = NotificationStream(self.broker, last_event_id=3)
+        self.broker.publish("test", {"i": 5})
+        frames = [next(stream) for _ in range(4)]
+        self.assertEqual(
+            [frame.partition(b"\n")[0] for frame in frames],
+            [b"event: init", b"id: 4", b"id: 5", b"id: 6"],
+        )
+        self.assertEqual(next(stream), notifs.HEARTBEAT)
+
+        # only the last NOTIF_STREAM_HISTORY events are kept
+        self.assertEqual([event.id for event in self.broker.replay(0)], [4, 5, 6])
+
+    @override_settings(NOTIF_STREAM_HEARTBEAT_SECS=0.05)
+    async def test_async_stream(self):
+        for i in range(2):
+            self.broker.publish("test", {"i": i})
+        with mock.patch.object(notif_stream.AsyncHub, "POLL_SECS", 0.01):
+            stream = notifs.async_notification_stream(self.broker, last_event_id=1)
+            self.assertEqual(await anext(stream), b"event: init\ndata: {}\n\n")
+            self.assertTrue((await anext(stream)).startswith(b"id: 2\n"))
+            hub = notif_stream.get_hub(self.broker)
+            self.assertEqual(len(hub.queues), 1)
+
+            self.assertEqual(await anext(stream), notifs.HEARTBEAT)
+            self.broker.publish("test", {"i": 2})
+            self.assertTrue((await anext(stream)).startswith(b"id: 3\n"))
+
+            await stream.aclose()
+            self.assertFalse(hub.queues)
+            await hub.listener
+        self.assertFalse(self.broker.subscribers)
+
+    async def test_async_stream_subscribes_before_replaying(self):
+        self.broker.publish("test", {"i": 0})
+        async_subscribe = self.broker.async_subscribe
+
+        async def late_subscribe():
+            # published after the stream opened, but before the hub subscribed
+            self.broker.publish("test", {"i": 1})
+            return await async_subscribe()
+
+        with (
+            mock.patch.object(notif_stream.AsyncHub, "POLL_SECS", 0.01),
+            mock.patch.object(
+                self.broker, "async_subscribe", side_effect=late_subscribe
+            ),
+        ):
+            stream = notifs.async_notification_stream(self.broker, last_event_id=1)
+            await anext(stream)  # init
+            self.assertTrue((await anext(stream)).startswith(b"id: 2\n"))
+            await stream.aclose()
+            await notif_stream.get_hub(self.broker).listener
+
+    @override_settings(NOTIF_STREAM_QUEUE_SIZE=1)
+    async def test_async_stream_drops_slow_clients(self):
+        hub = notif_stream.AsyncHub(self.broker)
+        with mock.patch.object(hub, "listen", mock.AsyncMock()):
+            stream_queue = hub.subscribe()
+        hub.relay(notif_stream.Event(1, b""))
+        hub.relay(notif_stream.Event(2, b""))
+        self.assertIs(stream_queue.get_nowait(), notif_stream.OVERFLOW)
+        self.assertFalse(hub.queues)
+
+    def test_saves_are_published_on_commit(self):
+        subscription = self.broker.subscribe()
+        with (
+            mock.patch.object(notifs, "get_broker", return_value=self.broker),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            Announcement.objects.create(
+                organization=self.org,
+                author=self.user,
+                title="Title",
+                show_after=timezone.now(),
+            )
+            self.assertIsNone(subscription.get(timeout=0))
+        event_line, data_line = subscription.get(timeout=0).frame.splitlines()[1:3]
+        self.assertEqual(event_line, b"event: announcement_change")
+        self.assertEqual(json.loads(data_line[len(b"data: ") :])["title"], "Title")
+
+    def test_view_streams_to_event_source_clients(self):
+        self.broker.publish("test", {"i": 0})
+        with mock.patch.object(notifs, "get_broker", return_value=self.broker):
+            res = self.client.get(
+                "/api/notifications/new?lastEventId=0", HTTP_ACCEPT="text/event-stream"
+            )
+            self.assertEqual(res.status_code, 200)
+            frames = iter(res.streaming_content)
+            self.assertEqual(next(frames), b"event: init\ndata: {}\n\n")
+            self.assertTrue(next(frames).startswith(b"id: 1\n"))
+            res.close()
+
+    async def test_view_streams_asynchronously_under_asgi(self):
+        with mock.patch.object(notifs, "get_broker", return_value=self.broker):
+            res = await self.async_client.get(
+                "/api/notifications/new", ACCEPT="text/event-stream"
+            )
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res.is_async)
+            frames = aiter(res.streaming_content)
+            self.assertEqual(await anext(frames), b"event: init\ndata: {}\n\n")
+            await frames.aclose()
+
+    def test_publish_failure_does_not_fail_the_save(self):
+        broker = mock.Mock()
+        broker.publish.side_effect = ConnectionError
+        with (
+            mock.patch.object(notifs, "get_broker", return_value=broker),
+            self.assertLogs(level="ERROR"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            Announcement.objects.create(
+                organization=self.org,
+                author=self.user,
+                title="Title",
+                show_after=timezone.now(),
+            )
+        broker.publish.assert_called_once()
+
+    def test_serializes_once_for_every_stream(self):
+        streams = [NotificationStream(self.broker) for _ in range(3)]
+        for stream in streams:
+            next(stream)
+        snapshot = notif_stream.metrics.snapshot()
+        with (
+            mock.patch.object(notifs, "get_broker", return_value=self.broker),
+            mock.patch.object(
+                notifs, "serializer", wraps=notifs.serializer
+            ) as serializer,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            Announcement.objects.create(
+                organization=self.org,
+                author=self.user,
+                title="Title",
+                show_after=timezone.now(),
+            )
+        serializer.assert_called_once()
+        frames = [next(stream) for stream in streams]
+        # the very same buffer is handed to every stream
+        self.assertTrue(all(frame is frames[0] for frame in frames))
+
+        after = notif_stream.metrics.snapshot()
+        self.assertEqual(after["fanouts"] - snapshot["fanouts"], 1)
+        self.assertEqual(after["deliveries"] - snapshot["deliveries"], 3)
+        for stream in streams:
+            stream.close()
+        self.assertEqual(
+            notif_stream.metrics.snapshot()["subscribers"],
+            snapshot["subscribers"] - 3,
+        )
@@ -1,9 +1,22 @@
+import datetime
+from unittest import mock
+
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
+from core import tasks
 from core.admin import User
-from core.models import Announcement, BlogPost, Comment, Organization, Post
+from core.models import (
+    Announcement,
+    BlogPost,
+    Comment,
+    DailyAnnouncement,
+    Organization,
+    Post,
+)
 
 
 def create_school_org(user: User) -> Organization:
@@ -63,6 +76,64 @@ class TestAnnouncement(TestCase):
         self.assertEqual(approved, ["abc", "bar", "foo"])
 
 
+class TestObjectCursorPagination(TestCase):
+    def setUp(self):
+        org = create_school_org(create_user())
+        now = timezone.now()
+        for i in range(7):
+            create_announcement(org, "a", f"ann{i}")
+        # ties on show_after are ordered by id
+        Announcement.objects.filter(title__in=["ann0", "ann2", "ann4", "ann6"]).update(
+            show_after=now - datetime.timedelta(hours=1)
+        )
+        Announcement.objects.filter(title__in=["ann1", "ann3", "ann5"]).update(
+            show_after=now - datetime.timedelta(hours=2)
+        )
+        self.expected = list(
+            Announcement.objects.order_by("-show_after", "-id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def walk(self, url, direction):
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            for query in queries:
+                self.assertNotIn("OFFSET", query["sql"])
+                self.assertNotIn("COUNT(", query["sql"])
+            pages.append([ann["id"] for ann in response.data["results"]])
+            url = response.data[direction]
+            if url:
+                self.assertTrue(url.startswith("https://"))
+                url = url.removeprefix("https://testserver")
+        return pages
+
+    def test_walks_every_page_without_count_or_offset(self):
+        pages = self.walk("/api/v3/obj/announcement?cursor=&limit=3", "next")
+        # the page boundaries fall inside the group of ties
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_walks_back_with_previous(self):
+        response = self.client.get("/api/v3/obj/announcement?cursor=&limit=3")
+        second = response.data["next"].removeprefix("https://testserver")
+        third = self.client.get(second).data["next"].removeprefix("https://testserver")
+        pages = self.walk(third, "previous")
+        self.assertEqual(sum(reversed(pages), []), self.expected)
+
+    def test_rejects_malformed_cursor(self):
+        response = self.client.get("/api/v3/obj/announcement", {"cursor": "cD0x"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_limit_offset_by_default(self):
+        response = self.client.get("/api/v3/obj/announcement", {"limit": 3})
+        self.assertEqual(response.data["count"], 7)
+
+
 class TestComments(TestCase):
     def test_get_approved(self):
         org = create_school_org(create_user())
@@ -75,3 +146,82 @@ class TestComments(TestCase):
         create_comment(org.owner, blog, "sah dude")
         self.assertTrue(ann.comments.count() == 2)
         self.assertTrue(blog.comments.count() == 3)
+
+
+class FakeWorksheet:
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    def get_all_values(self):
+        # like gspread, every row is padded to the width of the widest one
+        self.reads += 1
+        width = max(map(len, self.rows), default=0)
+        return [list(row) + [""] * (width - len(row)) for row in self.rows]
+
+
+class FakeSheetsClient:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def open_by_key(self, key):
+        return mock.Mock(sheet1=self.worksheet)
+
+
+def sheet_row(club, start, end, content):
+    return ["", "", "", "", "", club, start, end, content]
+
+
+@override_settings(GOOGLE_SHEET_KEY="sheet")
+class TestFetchAnnouncements(TestCase):
+    def setUp(self):
+        self.worksheet = FakeWorksheet(
+            [
+                tasks.ANNOUNCEMENTS_SHEET_HEADER,
+                sheet_row("Chess", "09/03/2024", "09/05/2024", "Chess club today"),
+                sheet_row("Math", "not a date", "09/05/2024", "Math contest"),
+                sheet_row(" Art ", "09/04/2024", "09/04/2024", " Art show "),
+            ]
+        )
+
+    def fetch(self):
+        client = FakeSheetsClient(self.worksheet)
+        with mock.patch.object(tasks, "load_client", return_value=(client, None, True)):
+            tasks.fetch_announcements()
+
+    def test_imports_new_rows_once(self):
+        self.fetch()
+        self.assertEqual(
+            list(
+                DailyAnnouncement.objects.order_by("id").values_list(
+                    "organization", "start_date", "content"
+                )
+            ),
+            [
+                ("Chess", datetime.date(2024, 9, 3), "Chess club today"),
+                ("Art", datetime.date(2024, 9, 4), "Art show"),
+            ],
+        )
+
+        self.worksheet.rows.append(
+            sheet_row("Band", "09/06/2024", "09/06/2024", "Band practice")
+        )
+        with self.assertNumQueries(2):  # existing hashes, then one insert
+            self.fetch()
+        self.assertEqual(DailyAnnouncement.objects.count(), 3)
+        self.assertEqual(self.worksheet.reads, 2)
+
+    def test_stops_at_empty_row_and_bad_header(self):
+        self.worksheet.rows.insert(2, [""] * 9)
+        self.fetch()
+        self.assertEqual(DailyAnnouncement.objects.get().organization, "Chess")
+
+        self.worksheet.rows[0] = ["Timestamp"]
+        DailyAnnouncement.objects.all().delete()
+        self.fetch()
+        self.assertFalse(DailyAnnouncement.objects.exists())
+
+    def test_stray_cell_does_not_widen_rows(self):
+        self.worksheet.rows[1] = self.worksheet.rows[1] + ["", "", "stray"]
+        self.fetch()
+        self.assertEqual(DailyAnnouncement.objects.count(), 2)
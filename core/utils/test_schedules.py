@@ -1,11 +1,22 @@
+import copy
 import datetime
+import random
+from io import StringIO
+from unittest import mock
 
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
 from django.test import TestCase
 from django.utils import timezone
 
+from ..middleware import CurrentTermMemoMiddleware
 from ..models import Event, Organization, Term, Timetable, User
-from . import get_week_schedule_info
+from ..templatetags.timetable_tags import render_timetable
+from . import IntervalIndex, compile_timetable_format, get_week_schedule_info
 
 
 def create_current_term():
@@ -48,6 +59,10 @@ def create_winter_break(school_org: Organization, term: Term):
 
 
 class TestGetWeekScheduleInfo(TestCase):
+    def setUp(self):
+        # terms are memoized in the cache, which is not rolled back between tests
+        cache.clear()
+
     def test_no_current_term_logged_in(self):
         user = create_user()
         info = get_week_schedule_info(user)
@@ -84,3 +99,336 @@ class TestGetWeekScheduleInfo(TestCase):
         info = get_week_schedule_info(user)
         self.assertFalse(info.nudge_add_timetable)
         self.assertTrue(info.logged_in)
+
+
+class TestIntervalIndex(TestCase):
+    def test_matches_linear_scan(self):
+        rng = random.Random(0)
+        intervals = [
+            (start, start + rng.randint(0, 10), i)
+            for i, start in enumerate(rng.randint(0, 100) for _ in range(50))
+        ]
+        index = IntervalIndex(intervals)
+        for lo in range(-5, 110):
+            for hi in (lo, lo + 1, lo + 7):
+                expected = [
+                    i for start, end, i in intervals if start <= hi and end >= lo
+                ]
+                self.assertEqual(sorted(index.overlapping(lo, hi)), expected)
+                self.assertEqual(index.count(lo, hi), len(expected))
+                if hi > lo:
+                    expected = [
+                        i for start, end, i in intervals if start < hi and end > lo
+                    ]
+                    self.assertEqual(
+                        sorted(index.overlapping(lo, hi, strict=True)), expected
+                    )
+                    self.assertEqual(index.count(lo, hi, strict=True), len(expected))
+
+    def test_empty(self):
+        index = IntervalIndex([])
+        self.assertEqual(index.count(0, 1), 0)
+        self.assertEqual(index.overlapping(0, 1), [])
+
+
+class TestTermDayNum(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.school_org = create_school_org(self.user)
+
+    def create_term(self, timetable_format: str) -> Term:
+        term = Term(
+            start_date=datetime.date(2024, 9, 2),  # Monday
+            end_date=datetime.date(2024, 12, 20),
+            timetable_format=timetable_format,
+        )
+        term.save()
+        return term
+
+    def create_day_event(
+        self, term: Term, date: datetime.date, schedule_format: str
+    ) -> Event:
+        start = timezone.make_aware(datetime.datetime.combine(date, datetime.time()))
+        event = Event(
+            name=schedule_format,
+            start_date=start,
+            end_date=start + datetime.timedelta(hours=23, minutes=59),
+            schedule_format=schedule_format,
+            organization=self.school_org,
+            term=term,
+        )
+        event.save()
+        return event
+
+    def test_consecutive_days(self):
+        term = self.create_term("pre-2020")
+        self.assertEqual(term.day_num(datetime.date(2024, 9, 2)), 1)
+        self.assertEqual(term.day_num(datetime.date(2024, 9, 3)), 2)
+        self.assertEqual(term.day_num(datetime.date(2024, 9, 6)), 1)
+        self.assertIsNone(term.day_num(datetime.date(2024, 9, 7)))  # weekend
+        self.assertEqual(term.day_num(datetime.date(2024, 9, 9)), 2)
+        self.assertIsNone(term.day_num(datetime.date(2024, 12, 20)))  # term ended
+
+    def test_non_instructional_day_shifts_cycle(self):
+        term = self.create_term("pre-2020")
+        self.assertEqual(term.day_num(datetime.date(2024, 9, 4)), 1)
+        event = self.create_day_event(term, datetime.date(2024, 9, 3), "default")
+        # pre-2020 has no PA day schedule, so flag the event by hand
+        Event.objects.filter(id=event.id).update(is_instructional=False)
+        Term.invalidate_cache(term.id)
+        self.assertFalse(term.day_is_instructional(datetime.date(2024, 9, 3)))
+        self.assertIsNone(term.day_num(datetime.date(2024, 9, 3)))
+        self.assertEqual(term.day_num(datetime.date(2024, 9, 4)), 2)
+
+    def test_event_save_invalidates_calendar(self):
+        term = self.create_term("2024-2025")
+        self.assertEqual(term.day_num(datetime.date(2024, 9, 3)), 1)
+        self.create_day_event(term, datetime.date(2024, 9, 3), "pa-day")
+        with self.assertNumQueries(1):
+            self.assertIsNone(term.day_num(datetime.date(2024, 9, 3)))
+            self.assertEqual(term.day_num(datetime.date(2024, 12, 19)), 1)
+
+
+class TestDayScheduleRange(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        school_org = create_school_org(self.user)
+        self.term = Term(
+            start_date=datetime.date(2024, 9, 3),
+            end_date=datetime.date(2025, 1, 31),
+            timetable_format="2024-2025",
+        )
+        self.term.save()
+        for day, schedule_format in (
+            (datetime.date(2024, 9, 11), "late-start"),
+            (datetime.date(2024, 9, 12), "half-day"),
+            (datetime.date(2024, 9, 20), "pa-day"),
+        ):
+            start = timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+            Event(
+                name=schedule_format,
+                start_date=start,
+                end_date=start + datetime.timedelta(hours=23),
+                schedule_format=schedule_format,
+                organization=school_org,
+                term=self.term,
+            ).save()
+        self.timetable = Timetable(term=self.term, owner=self.user)
+        self.timetable.save()
+        for position in (1, 2, 3, 6):
+            self.timetable.courses.create(
+                code=f"C{position}", term=self.term, position=position
+            )
+        self.start, self.end = datetime.date(2024, 9, 1), datetime.date(2024, 9, 30)
+
+    def test_term_range_matches_day_schedule(self):
+        schedules = self.term.day_schedule_range(self.start, self.end)
+        self.assertEqual(len(schedules), 30)
+        for target_date, schedule in schedules.items():
+            self.assertEqual(schedule, self.term.day_schedule(target_date))
+        self.assertEqual(schedules[datetime.date(2024, 9, 20)], [])
+
+    def test_timetable_range_matches_day_schedule(self):
+        schedules = self.timetable.day_schedule_range(self.start, self.end)
+        for target_date, schedule in schedules.items():
+            self.assertEqual(schedule, self.timetable.day_schedule(target_date))
+
+    def test_user_range_matches_timetable(self):
+        schedules = self.user.schedule_range(self.start, self.end)
+        for target_date, schedule in schedules.items():
+            self.assertEqual(schedule, self.timetable.day_schedule(target_date))
+            self.assertEqual(schedule, self.user.schedule(target_date))
+
+    def test_user_week_queries(self):
+        self.user.schedule_range(self.start, self.end)
+        # timetables with their terms, then courses
+        with self.assertNumQueries(2):
+            self.user.schedule_range(self.start, self.end)
+
+    def test_events_loaded_once_per_term(self):
+        Term.invalidate_cache(self.term.pk)
+        with self.assertNumQueries(1):
+            self.term.day_schedule_range(self.start, self.end)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.term.day_schedule_format(datetime.date(2024, 9, 11)),
+                "late-start",
+            )
+            self.assertFalse(self.term.day_is_instructional(datetime.date(2024, 9, 20)))
+            self.assertTrue(self.term.day_is_instructional(datetime.date(2025, 3, 3)))
+
+    def test_day_schedules_cached_until_event_changes(self):
+        late_start = datetime.date(2024, 9, 11)
+        self.term.day_schedule_range(self.start, self.end)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.term.day_schedule(late_start)[0]["time"]["start"].hour, 9
+            )
+            self.assertEqual(self.term.day_schedule_format(late_start), "late-start")
+        event = Event.objects.get(schedule_format="late-start")
+        event.schedule_format = "default"
+        event.save()
+        self.assertEqual(self.term.day_schedule_format(late_start), "default")
+        self.assertEqual(
+            self.term.day_schedule(late_start)[0]["time"]["start"].minute, 0
+        )
+
+    def test_event_moved_to_another_term(self):
+        pa_day = datetime.date(2024, 9, 20)
+        self.assertFalse(self.term.day_is_instructional(pa_day))
+        other_term = Term.objects.create(
+            start_date=datetime.date(2025, 2, 3),
+            end_date=datetime.date(2025, 6, 27),
+            timetable_format="2024-2025",
+        )
+        event = Event.objects.get(schedule_format="pa-day")
+        event.term = other_term
+        event.save()
+        self.assertTrue(self.term.day_is_instructional(pa_day))
+
+    def test_range_endpoint(self):
+        url = f"/api/term/{self.term.id}/schedule/range"
+        response = self.client.get(url, {"start": "2024-09-01", "end": "2024-09-30"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 30)
+        self.assertEqual(len(response.json()["2024-09-11"]), 4)
+        response = self.client.get(url, {"start": "2024-09-30", "end": "2024-09-01"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestCompileTimetableFormats(TestCase):
+    def test_compiles_all_formats(self):
+        for name, raw in settings.TIMETABLE_FORMATS.items():
+            tf = compile_timetable_format(name, raw)
+            self.assertEqual(len(tf.cycle_labels), raw["cycle"]["length"])
+            self.assertEqual(tf.schedule_priority[-1], next(iter(raw["schedules"])))
+
+    def test_rejects_malformed_period(self):
+        raw = copy.deepcopy(settings.TIMETABLE_FORMATS["pre-2020"])
+        raw["schedules"]["default"][0]["position"] = [{1}]
+        with self.assertRaises(ImproperlyConfigured):
+            compile_timetable_format("pre-2020", raw)
+        del raw["schedules"]["default"][0]["time"]
+        with self.assertRaises(ImproperlyConfigured):
+            compile_timetable_format("pre-2020", raw)
+
+
+class TestTimetableCourses(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.term = Term(
+            start_date=datetime.date(2024, 9, 3),
+            end_date=datetime.date(2025, 1, 31),
+            timetable_format="2024-2025",
+        )
+        self.term.save()
+        self.timetable = Timetable(term=self.term, owner=self.user)
+        self.timetable.save()
+        self.date = datetime.date(2024, 9, 4)  # day 2
+
+    def add_courses(self, *positions):
+        for position in positions:
+            self.timetable.courses.create(
+                code=f"C{position}", term=self.term, position=position
+            )
+
+    def test_resolves_lowest_position(self):
+        self.add_courses(3, 4, 6)
+        schedule = self.timetable.day_schedule(self.date)
+        self.assertEqual(
+            [period["course"] for period in schedule], [None, None, "C4", "C3"]
+        )
+
+    def test_merges_without_mutating_term_schedule(self):
+        self.add_courses(5)
+        term_schedule = self.term.day_schedule(self.date)
+        with mock.patch.object(Term, "day_schedule", return_value=term_schedule):
+            schedule = self.timetable.day_schedule(self.date)
+        self.assertEqual([period["course"] for period in schedule], ["C5", None, None])
+        self.assertEqual(schedule[0]["time"]["end"], term_schedule[1]["time"]["end"])
+        self.assertNotEqual(term_schedule[0]["time"]["end"], schedule[0]["time"]["end"])
+        self.assertTrue(
+            all(period["course"].startswith("Day 2") for period in term_schedule)
+        )
+
+    def test_render_timetable(self):
+        self.add_courses(1, 2, 3, 4)
+        html = render_timetable(self.timetable)
+        self.assertEqual(html.count("<tr>"), 5)
+        self.assertIn("<td>C3</td><td>C4</td>", html)
+        self.assertIn("<td>C4</td><td>C3</td>", html)
+
+    def test_render_timetable_cached_until_courses_change(self):
+        self.add_courses(1, 2)
+        html = render_timetable(self.timetable)
+        with self.assertNumQueries(0):
+            self.assertEqual(render_timetable(self.timetable), html)
+
+        self.add_courses(3)
+        self.assertIn("<td>C3</td>", render_timetable(self.timetable))
+
+        course = self.timetable.courses.get(position=3)
+        course.code = "D3"
+        course.save()
+        self.assertIn("<td>D3</td>", render_timetable(self.timetable))
+
+        course.timetables.clear()
+        self.assertNotIn("D3", render_timetable(self.timetable))
+        course.timetables.add(self.timetable)
+        self.assertIn("<td>D3</td>", render_timetable(self.timetable))
+
+        course.delete()
+        self.assertNotIn("D3", render_timetable(self.timetable))
+
+
+class TestTermGetCurrent(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_memoized_until_term_saved(self):
+        self.assertIsNone(Term.get_current())
+        with self.assertNumQueries(0):
+            self.assertIsNone(Term.get_current())
+        term = create_current_term()
+        self.assertEqual(Term.get_current(), term)
+        with Term.memoize_current():
+            with self.assertNumQueries(0):
+                self.assertIs(Term.get_current(), Term.get_current())
+
+    def test_middleware_memoizes_async_requests(self):
+        create_current_term()
+
+        async def view(request):
+            return await sync_to_async(
+                lambda: (Term.get_current(), Term.get_current())
+            )()
+
+        middleware = CurrentTermMemoMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        first, second = async_to_sync(middleware)(None)
+        self.assertIs(first, second)  # outside a request, every call gets a copy
+
+    def test_overlapping_terms_raise(self):
+        create_current_term()
+        Term.objects.create(
+            start_date=timezone.localdate() - datetime.timedelta(days=1),
+            end_date=timezone.localdate() + datetime.timedelta(days=1),
+            timetable_format="week",
+        )
+        with self.assertRaises(Term.MisconfiguredTermError):
+            Term.get_current()
+
+
+class TestBenchmarkSchedules(TestCase):
+    def test_runs_and_rolls_back(self):
+        cache.clear()
+        out = StringIO()
+        call_command(
+            "benchmark_schedules", formats=["week"], timetables=3, repeat=1, stdout=out
+        )
+        self.assertIn("GET me/schedule/week", out.getvalue())
+        self.assertFalse(Term.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith="benchmark").exists())
+        # the cache versions of the rolled back pks are gone too
+        self.assertFalse([key for key in cache._cache if "_version:" in key])
@@ -0,0 +1,229 @@
+"""
+Compiled, validated form of settings.TIMETABLE_FORMATS.
+
+The formats are compiled once when the core app is ready, so a malformed format fails at boot instead of on a live request.
+"""
+
+from __future__ import annotations
+
+import datetime
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterable, Mapping
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+CYCLE_DURATIONS = ("day", "week")
+DAY_NUM_METHODS = ("consecutive", "calendar_days")
+
+
+@dataclass(frozen=True)
+class Period:
+    description: Mapping[str, str]
+    start: datetime.time
+    end: datetime.time
+    # the following are indexed by cycle day
+    positions: tuple[frozenset[int], ...]
+    position_masks: tuple[int, ...]  # bit n is set if position n can hold this period
+    course_labels: tuple[str, ...]  # e.g. "Day 1 Period 1"
+
+
+@dataclass(frozen=True)
+class TimetableFormat:
+    name: str
+    schedules: Mapping[str, tuple[Period, ...]]
+    schedule_priority: tuple[str, ...]  # schedule formats, highest priority first
+    courses: int
+    positions: frozenset[int]
+    cycle_length: int
+    cycle_duration: str
+    cycle_labels: tuple[str, ...]  # e.g. "Day 1", per cycle day
+    day_num_method: str
+    masks: Mapping[frozenset[int], int]  # bitmask of every period's positions
+
+    def resolve_schedule_format(self, event_schedule_formats: Iterable[str]) -> str:
+        """
+        Picks the schedule format of a day from the schedule formats of the events overlapping it.
+        """
+        event_schedule_formats = set(event_schedule_formats)
+        for schedule_format in self.schedule_priority:
+            if schedule_format in event_schedule_formats:
+                return schedule_format
+        return "default"
+
+    def is_instructional(self, schedule_format: str) -> bool:
+        # PA days and holidays do not have time data
+        return len(self.schedules[schedule_format]) > 0
+
+
+def positions_mask(positions: Iterable[int]) -> int:
+    mask = 0
+    for position in positions:
+        mask |= 1 << position
+    return mask
+
+
+class CourseResolver:
+    """
+    Resolves which of a timetable's courses is held in a period.
+    The occupied positions are encoded as a bitmask once, so each period is resolved with a single AND.
+    """
+
+    def __init__(self, courses: Iterable):
+        self.courses = {}
+        for course in courses:
+            self.courses[course.position] = course
+        self.mask = positions_mask(self.courses)
+
+    def resolve(self, period_mask: int):
+        """
+        Returns the course in the lowest position matching period_mask, or None.
+        """
+        matching = self.mask & period_mask
+        if not matching:
+            return None
+        return self.courses[(matching & -matching).bit_length() - 1]
+
+
+def _fail(name: str, msg: str):
+    raise ImproperlyConfigured(f"TIMETABLE_FORMATS[{name!r}]: {msg}")
+
+
+def _compile_time(name: str, where: str, value) -> datetime.time:
+    try:
+        return datetime.time(*value)
+    except (TypeError, ValueError) as exc:
+        _fail(name, f"{where}: invalid time {value!r} ({exc})")
+
+
+def _compile_period(
+    name: str, where: str, raw: dict, positions: frozenset[int], cycle_labels
+) -> Period:
+    try:
+        description, times, raw_positions = (
+            raw["description"],
+            raw["time"],
+            raw["position"],
+        )
+        description["time"], description["course"]
+    except (KeyError, TypeError) as exc:
+        _fail(name, f"{where}: missing key {exc}")
+    if len(times) != 2:
+        _fail(name, f"{where}: time must be a [start, end] pair")
+    start = _compile_time(name, where, times[0])
+    end = _compile_time(name, where, times[1])
+    if start >= end:
+        _fail(name, f"{where}: period must start before it ends")
+    if len(raw_positions) != len(cycle_labels):
+        _fail(
+            name,
+            f"{where}: has {len(raw_positions)} position sets but the cycle is {len(cycle_labels)} long",
+        )
+    period_positions = tuple(frozenset(day) for day in raw_positions)
+    for day in period_positions:
+        if not day <= positions:
+            _fail(name, f"{where}: positions {set(day - positions)} are not declared")
+    return Period(
+        description=MappingProxyType(dict(description)),
+        start=start,
+        end=end,
+        positions=period_positions,
+        position_masks=tuple(positions_mask(day) for day in period_positions),
+        course_labels=tuple(
+            f"{cycle_label} {description['course']}" for cycle_label in cycle_labels
+        ),
+    )
+
+
+def compile_timetable_format(name: str, raw: dict) -> TimetableFormat:
+    try:
+        raw_schedules, courses, raw_positions, cycle = (
+            raw["schedules"],
+            raw["courses"],
+            raw["positions"],
+            raw["cycle"],
+        )
+        cycle_length, cycle_duration = cycle["length"], cycle["duration"]
+        raw["question"]["prompt"], raw["question"]["choices"]
+    except (KeyError, TypeError) as exc:
+        _fail(name, f"missing key {exc}")
+
+    if not isinstance(cycle_length, int) or cycle_length < 1:
+        _fail(name, "cycle length must be a positive integer")
+    if cycle_duration not in CYCLE_DURATIONS:
+        _fail(name, f"cycle duration must be one of {CYCLE_DURATIONS}")
+    day_num_method = raw.get("day_num_method", "consecutive")
+    if day_num_method not in DAY_NUM_METHODS:
+        _fail(name, f"day_num_method must be one of {DAY_NUM_METHODS}")
+    if day_num_method == "calendar_days" and cycle_length != 2:
+        _fail(name, "calendar_days cannot be used in formats where cycle length != 2")
+    positions = frozenset(raw_positions)
+    if not all(isinstance(p, int) and p >= 0 for p in positions):
+        _fail(name, "positions must be non-negative integers")
+    if "default" not in raw_schedules:
+        _fail(name, 'schedules must include "default"')
+
+    cycle_labels = tuple(
+        f"{cycle_duration.title()} {day_num}" for day_num in range(1, cycle_length + 1)
+    )
+    schedules = {
+        schedule_format: tuple(
+            _compile_period(
+                name,
+                f"schedules[{schedule_format!r}][{i}]",
+                period,
+                positions,
+                cycle_labels,
+            )
+            for i, period in enumerate(periods)
+        )
+        for schedule_format, periods in raw_schedules.items()
+    }
+
+    masks = {
+        positions: mask
+        for periods in schedules.values()
+        for period in periods
+        for positions, mask in zip(period.positions, period.position_masks)
+    }
+
+    return TimetableFormat(
+        name=name,
+        schedules=MappingProxyType(schedules),
+        # schedule formats listed later take priority
+        schedule_priority=tuple(reversed(schedules.keys())),
+        courses=courses,
+        positions=positions,
+        cycle_length=cycle_length,
+        cycle_duration=cycle_duration,
+        cycle_labels=cycle_labels,
+        day_num_method=day_num_method,
+        masks=MappingProxyType(masks),
+    )
+
+
+def compile_timetable_formats(
+    raw_formats: dict,
+) -> Mapping[str, TimetableFormat]:
+    return MappingProxyType(
+        {name: compile_timetable_format(name, raw) for name, raw in raw_formats.items()}
+    )
+
+
+_compiled_formats: Mapping[str, TimetableFormat] | None = None
+
+
+def load_timetable_formats() -> Mapping[str, TimetableFormat]:
+    """
+    Compiles settings.TIMETABLE_FORMATS. Called once from CoreConfig.ready().
+    """
+    global _compiled_formats
+    _compiled_formats = compile_timetable_formats(settings.TIMETABLE_FORMATS)
+    return _compiled_formats
+
+
+def get_timetable_format(name: str) -> TimetableFormat:
+    if _compiled_formats is None:
+        load_timetable_formats()
+    return _compiled_formats[name]
@@ -23,7 +23,9 @@ class TimetableList(LoginRequiredMixin, ListView, FormMixin, mixins.TitleMixin):
     form_class = AddTimetableSelectTermForm
 
     def get_queryset(self):
-        return models.Timetable.objects.filter(owner=self.request.user)
+        return models.Timetable.objects.filter(owner=self.request.user).select_related(
+            "term"
+        )
 
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -32,6 +32,8 @@ DATABASES = {
 }
 
 CELERY_BROKER_URL = "redis://redis:6379"
+NOTIF_STREAM_BROKER = "core.api.utils.notif_stream.RedisBroker"
+NOTIF_STREAM_REDIS_URL = "redis://redis:6379"
 
 try:
     with open(os.path.join(os.path.dirname(__file__), "docker_local_settings.py")) as f:  # noqa: F821
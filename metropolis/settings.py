@@ -64,6 +64,7 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.contrib.flatpages.middleware.FlatpageFallbackMiddleware",
     "core.middleware.CustomRedirectFallbackTemporaryMiddleware",
+    "core.middleware.CurrentTermMemoMiddleware",
     "oauth2_provider.middleware.OAuth2TokenMiddleware",
     "hijack.middleware.HijackUserMiddleware",
     "allauth.account.middleware.AccountMiddleware",
@@ -181,6 +182,9 @@ AUTHENTICATION_BACKENDS = [
     "allauth.account.auth_backends.AuthenticationBackend",
 ]
 
+# users scrubbed per transaction by delete_expired_users
+DELETE_EXPIRED_USERS_CHUNK_SIZE = 500
+
 # NavBar settings
 
 NAVBAR = {
@@ -235,6 +239,7 @@ GLOBAL_LOOKUPS: Final[List[str]] = [
 IGNORED_QUERY_PARAMS: List[str] = [
     "limit",
     "offset",
+    "cursor",
     "search_type",
     "format",
 ]  # query params that are ignored by the API (e.g., for lookups)
@@ -544,11 +549,31 @@ CELERY_TIMEZONE = "America/Toronto"
 
 # (Expo) Notifications
 
+# defaults to https://exp.host, point it at a local stand-in for testing
+NOTIF_EXPO_HOST = None
 NOTIF_EXPO_TIMEOUT_SECS = 3
+NOTIF_EXPO_BATCH_SIZE = 100  # Expo accepts at most 100 messages per request
+NOTIF_FANOUT_CHUNK_SIZE = 500  # users per notif_batch task
+# receipts are usually ready within 15 minutes
+NOTIF_RECEIPT_DELAY = timedelta(minutes=15)
+NOTIF_RECEIPT_TTL = timedelta(days=1)  # Expo keeps receipts for a day
+# notifications in these categories sent to a user within the window of the last one are merged into one summary
+NOTIF_COALESCE_WINDOW = timedelta(minutes=5)
+NOTIF_COALESCE_CATEGORIES = ["ann.public", "ann.personal", "blog"]
+NOTIF_USER_RATE_LIMIT = (10, timedelta(hours=1))  # (pushes, period) per user, or None
 
 ANNOUNCEMENTS_NOTIFY_FEEDS = []  # list of PKs of organizations
 EVENTS_NOTIFY_FEEDS = []  # list of PKs of organizations
 NOTIF_DRY_RUN = True
+# live events for /api/notifications/new; the in-memory broker only reaches streams in the same process,
+# use "core.api.utils.notif_stream.RedisBroker" with more than one worker
+NOTIF_STREAM_BROKER = "core.api.utils.notif_stream.InMemoryBroker"
+NOTIF_STREAM_REDIS_URL = "redis://localhost:6379"
+NOTIF_STREAM_CHANNEL = "metropolis:notifications"
+NOTIF_STREAM_HISTORY = 100  # events kept for clients resuming with Last-Event-ID
+NOTIF_STREAM_HEARTBEAT_SECS = 15
+# events buffered per ASGI stream before a slow client is disconnected
+NOTIF_STREAM_QUEUE_SIZE = 100
 NOTIFICATIONS_ENABLED = False
 
 
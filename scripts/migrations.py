@@ -1,69 +1,99 @@
 from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
 
-from core.models import User
+from core.models import Organization, User
 
 
 def migrate_groups():
+    """
+    Brings the Org Owners, Execs and Supervisors groups and the is_staff flags in line with
+    the organizations every user owns, leads and supervises.
+
+    Every user is classified with annotated subqueries, so the number of queries does not depend on the number of users.
+    The counters are the ones the previous per-user loop reported: a non-teacher who no longer leads an organization
+    but still owns one is counted as removed from and added back to staff.
+    """
     owner_group, _ = Group.objects.get_or_create(name="Org Owners")
     execs_group, _ = Group.objects.get_or_create(name="Execs")
     supervisor_group, _ = Group.objects.get_or_create(name="Supervisors")
-    count = {
-        "exec": {"added": 0, "removed": 0},
-        "supervisor": {"added": 0, "removed": 0},
-        "owner": {"added": 0, "removed": 0},
-        "staff": {"added": 0, "removed": 0},
+    Membership = User.groups.through
+
+    def member_of(group):
+        return Exists(
+            Membership.objects.filter(user_id=OuterRef("pk"), group_id=group.id)
+        )
+
+    users = User.objects.annotate(
+        supervising=Exists(
+            Organization.supervisors.through.objects.filter(user_id=OuterRef("pk"))
+        ),
+        leading=Exists(
+            Organization.execs.through.objects.filter(user_id=OuterRef("pk"))
+        ),
+        owning=Exists(Organization.objects.filter(owner_id=OuterRef("pk"))),
+        in_owners=member_of(owner_group),
+        in_execs=member_of(execs_group),
+        in_supervisors=member_of(supervisor_group),
+    )
+
+    teacher = Q(is_teacher=True)
+    staff = Q(is_staff=True)
+    superuser = Q(is_superuser=True)
+    leading = Q(leading=True)
+    owning = Q(owning=True)
+    # (group, annotation of membership, who should be in it)
+    groups = {
+        "exec": (execs_group, "in_execs", leading),
+        "supervisor": (
+            supervisor_group,
+            "in_supervisors",
+            teacher & Q(supervising=True),
+        ),
+        "owner": (owner_group, "in_owners", owning),
     }
-    for user in User.objects.all():
-        if user.is_teacher:
-            if not user.is_staff:
-                user.is_staff = True
-                user.save()
-                count["staff"]["added"] += 1
-            if user.organizations_supervising.count() >= 1:
-                if not user.groups.filter(name="Supervisors").exists():
-                    user.groups.add(supervisor_group)
-                    count["supervisor"]["added"] += 1
-            else:
-                if user.groups.filter(name="Supervisors").exists():
-                    user.groups.remove(supervisor_group)
-                    count["supervisor"]["removed"] += 1
-        else:
-            if user.groups.filter(name="Supervisors").exists():
-                user.groups.remove(supervisor_group)
-                count["supervisor"]["removed"] += 1
-        if user.organizations_leading.count() >= 1:
-            if not user.is_staff:
-                user.is_staff = True
-                user.save()
-                count["staff"]["added"] += 1
-            if not user.groups.filter(name="Execs").exists():
-                user.groups.add(execs_group)
-                count["exec"]["added"] += 1
-        else:
-            if all([user.is_staff, not user.is_superuser, not user.is_teacher]):
-                user.is_staff = False
-                user.save()
-                count["staff"]["removed"] += 1
-            if user.groups.filter(name="Execs").exists():
-                user.groups.remove(execs_group)
-                count["exec"]["removed"] += 1
-        if user.organizations_owning.count() >= 1:
-            if not user.is_staff:
-                user.is_staff = True
-                user.save()
-                count["staff"]["added"] += 1
-            if not user.groups.filter(name="Org Owners").exists():
-                user.groups.add(owner_group)
-                count["owner"]["added"] += 1
-        else:
-            if user.organizations_leading.count() == 0:
-                if all([user.is_staff, not user.is_superuser, not user.is_teacher]):
-                    user.is_staff = False
-                    user.save()
-                    count["staff"]["removed"] += 1
-            if user.groups.filter(name="Org Owners").exists():
-                user.groups.remove(owner_group)
-                count["owner"]["removed"] += 1
+    should_be_staff = teacher | leading | owning | (superuser & staff)
+
+    staff_added = (
+        (teacher & ~staff)
+        | (~teacher & leading & ~staff)
+        | (~teacher & ~leading & owning & ~(superuser & staff))
+    )
+    staff_removed = ~teacher & ~leading & ~superuser & staff
+
+    with transaction.atomic():
+        totals = users.aggregate(
+            staff_added=Count("pk", filter=staff_added),
+            staff_removed=Count("pk", filter=staff_removed),
+        )
+        count = {
+            name: {"added": 0, "removed": 0} for name in ("exec", "supervisor", "owner")
+        }
+        count["staff"] = {
+            "added": totals["staff_added"],
+            "removed": totals["staff_removed"],
+        }
+
+        for name, (group, member, target) in groups.items():
+            to_add = list(
+                users.filter(target & Q(**{member: False})).values_list("pk", flat=True)
+            )
+            Membership.objects.bulk_create(
+                Membership(user_id=user_id, group_id=group.id) for user_id in to_add
+            )
+            count[name]["added"] = len(to_add)
+            count[name]["removed"], _ = Membership.objects.filter(
+                group_id=group.id,
+                user_id__in=users.filter(~target & Q(**{member: True})).values("pk"),
+            ).delete()
+
+        User.objects.filter(
+            pk__in=users.filter(should_be_staff & ~staff).values("pk")
+        ).update(is_staff=True)
+        User.objects.filter(
+            pk__in=users.filter(~should_be_staff & staff).values("pk")
+        ).update(is_staff=False)
+
     print(f"Added {count['exec']['added']} users to execs group")
     print(f"Removed {count['exec']['removed']} users from execs group")
     print(f"Added {count['owner']['added']} users to owners group")
@@ -77,3 +107,4 @@ def migrate_groups():
     print("total in owners group: " + str(owner_group.user_set.count()))
     print("total in supervisors group: " + str(supervisor_group.user_set.count()))
     print("total staff: " + str(User.objects.filter(is_staff=True).count()) + "\n")
+    return count